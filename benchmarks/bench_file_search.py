@@ -0,0 +1,272 @@
+"""Benchmarks for the file_search engines (search_excel, search_pdf_advanced and search_word).
+
+A reproducible corpus is generated in a temporary folder: a wide Excel sheet,
+a PDF with a text layer, a scanned PDF (pages are images only) and a table-heavy
+Word document. Each engine is run with a varying number of search terms and the
+median per-term latency, throughput (rows or pages per second) and peak memory are reported.
+Latency is timed without tracemalloc after a warm-up run, peak memory is measured
+in a separate pass.
+
+Usage (from the project root):
+    python benchmarks/bench_file_search.py
+    python benchmarks/bench_file_search.py --term-counts 1 10 50 --repeats 5 --output bench_output.txt
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+import psutil
+import fitz
+from docx import Document
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from file_search.search_excel import search_excel
+from file_search.search_pdf import search_pdf_advanced, SharedPdf
+from file_search.search_word import search_word
+
+WORDS = [
+    "jacket", "backpack", "waterproof", "recycled", "polyester", "nylon", "zipper",
+    "pocket", "hood", "lightweight", "insulated", "organic", "cotton", "wool",
+    "shell", "strap", "padded", "laptop", "reflective", "durable",
+]  # fmt: skip
+
+
+def make_article_numbers(rng, count):
+    """Generate unique supplier style article numbers like NF0A3XYZ."""
+    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ0123456789"
+    article_numbers = set()
+    while len(article_numbers) < count:
+        article_numbers.add("NF" + "".join(rng.choice(alphabet) for _ in range(6)))
+    return sorted(article_numbers)
+
+
+def make_sentence(rng, word_count=12):
+    return " ".join(rng.choice(WORDS) for _ in range(word_count)).capitalize() + "."
+
+
+def create_excel(path, rng, article_numbers, rows, columns):
+    """Create a wide sheet with one article number per row."""
+    data = {
+        "Article": [rng.choice(article_numbers) for _ in range(rows)],
+        "Name": [make_sentence(rng, 3) for _ in range(rows)],
+    }
+    for column in range(columns - 2):
+        data[f"Attribute {column + 1}"] = [make_sentence(rng, 4) for _ in range(rows)]
+    pd.DataFrame(data).to_excel(path, index=False, engine="openpyxl")
+
+
+def create_text_pdf(path, rng, article_numbers, pages, lines_per_page=40):
+    """Create a PDF with a text layer, headers, footers and article numbers."""
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        lines = [f"Supplier catalog 2024 - page {page_number + 1}"]
+        for _ in range(lines_per_page):
+            lines.append(f"{rng.choice(article_numbers)} {make_sentence(rng, 8)}")
+        page.insert_text((40, 40), "\n".join(lines), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def create_scanned_pdf(path, rng, article_numbers, pages):
+    """Create a PDF where every page is an image without a text layer."""
+    text_doc = fitz.open()
+    scanned_doc = fitz.open()
+    for _ in range(pages):
+        text_page = text_doc.new_page()
+        lines = [
+            f"{rng.choice(article_numbers)} {make_sentence(rng, 6)}" for _ in range(30)
+        ]
+        text_page.insert_text((40, 40), "\n".join(lines), fontsize=10)
+        pixmap = text_page.get_pixmap(dpi=150)
+        scanned_page = scanned_doc.new_page(
+            width=text_page.rect.width, height=text_page.rect.height
+        )
+        scanned_page.insert_image(scanned_page.rect, pixmap=pixmap)
+    scanned_doc.save(path)
+    scanned_doc.close()
+    text_doc.close()
+
+
+def create_word(path, rng, article_numbers, tables, rows_per_table=20):
+    """Create a Word document with paragraphs and many spec tables."""
+    doc = Document()
+    for table_number in range(tables):
+        doc.add_paragraph(f"Spec sheet {table_number + 1}: {make_sentence(rng)}")
+        table = doc.add_table(rows=rows_per_table, cols=3)
+        for row in table.rows:
+            row.cells[0].text = rng.choice(article_numbers)
+            row.cells[1].text = rng.choice(WORDS)
+            row.cells[2].text = make_sentence(rng, 5)
+    doc.save(path)
+
+
+def measure(search_func, search_terms, repeats=3):
+    """Run the search for every term and return
+    (median latency per term, peak python memory MB, peak RSS MB).
+
+    The first search is a warm-up and is not timed. Every term is timed repeats times
+    with tracemalloc off, since tracing slows Python code down a lot. Peak memory is
+    measured in one extra, untimed pass."""
+    search_func(search_terms[0])
+
+    latencies = []
+    for search_term in search_terms:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            search_func(search_term)
+            timings.append(time.perf_counter() - start)
+        latencies.append(statistics.median(timings))
+
+    process = psutil.Process()
+    peak_rss = process.memory_info().rss
+    tracemalloc.start()
+    for search_term in search_terms:
+        search_func(search_term)
+        peak_rss = max(peak_rss, process.memory_info().rss)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak_traced / (1024 * 1024), peak_rss / (1024 * 1024)
+
+
+def pick_search_terms(rng, article_numbers, count, missing_ratio=0.2):
+    """Pick search terms, a share of them not present in the corpus."""
+    missing_terms = make_article_numbers(random.Random(-1), count * 2)
+    search_terms = []
+    for _ in range(count):
+        if rng.random() < missing_ratio:
+            search_terms.append(rng.choice(missing_terms))
+        else:
+            search_terms.append(rng.choice(article_numbers))
+    return search_terms
+
+
+def run_benchmarks(args):
+    rng = random.Random(args.seed)
+    article_numbers = make_article_numbers(rng, args.articles)
+    results = []
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        excel_path = os.path.join(corpus_dir, "wide_sheet.xlsx")
+        text_pdf_path = os.path.join(corpus_dir, "text_layer.pdf")
+        scanned_pdf_path = os.path.join(corpus_dir, "scanned.pdf")
+        word_path = os.path.join(corpus_dir, "tables.docx")
+
+        print("Generating corpus...")
+        create_excel(excel_path, rng, article_numbers, args.rows, args.columns)
+        create_text_pdf(text_pdf_path, rng, article_numbers, args.pages)
+        create_scanned_pdf(scanned_pdf_path, rng, article_numbers, args.scanned_pages)
+        create_word(word_path, rng, article_numbers, args.tables)
+
+        df = pd.read_excel(excel_path, engine="openpyxl", na_filter=False)
+        word_doc = Document(word_path)
+        word_units = len(word_doc.paragraphs) + len(word_doc.tables)
+
+        for term_count in args.term_counts:
+            search_terms = pick_search_terms(
+                random.Random(args.seed + term_count), article_numbers, term_count
+            )
+
+            if "excel" in args.engines:
+                results.append(
+                    ("excel", "wide sheet", "rows", len(df), term_count)
+                    + measure(
+                        lambda term: search_excel(df, term), search_terms, args.repeats
+                    )
+                )
+
+            if "word" in args.engines:
+                results.append(
+                    ("word", "tables docx", "blocks", word_units, term_count)
+                    + measure(
+                        lambda term: search_word(word_doc, term),
+                        search_terms,
+                        args.repeats,
+                    )
+                )
+
+            if "pdf" in args.engines:
+                for label, pdf_path, pages in (
+                    ("text pdf", text_pdf_path, args.pages),
+                    ("scanned pdf", scanned_pdf_path, args.scanned_pages),
+                ):
+                    with SharedPdf(pdf_path) as shared_pdf:
+                        results.append(
+                            ("pdf", label, "pages", pages, term_count)
+                            + measure(
+                                lambda term: search_pdf_advanced(
+                                    shared_pdf.pdf, shared_pdf.doc, term
+                                ),
+                                search_terms,
+                                args.repeats,
+                            )
+                        )
+
+    return results
+
+
+def format_results(results):
+    header = (
+        f"{'engine':<7} {'corpus':<12} {'terms':>5} {'median ms':>10} "
+        f"{'units/s':>12} {'peak py MB':>11} {'peak rss MB':>12}"
+    )
+    lines = [header, "-" * len(header)]
+    for (
+        engine,
+        corpus,
+        unit,
+        unit_count,
+        term_count,
+        latencies,
+        peak_traced,
+        peak_rss,
+    ) in results:
+        median_seconds = statistics.median(latencies)
+        per_term_ms = median_seconds * 1000
+        throughput = unit_count / median_seconds if median_seconds else 0
+        lines.append(
+            f"{engine:<7} {corpus:<12} {term_count:>5} {per_term_ms:>10.1f} "
+            f"{throughput:>8.1f} {unit:<3} {peak_traced:>11.1f} {peak_rss:>12.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--articles", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--columns", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--scanned-pages", type=int, default=5)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--term-counts", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Timed runs per term, the median is reported"
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=["excel", "pdf", "word"],
+        default=["excel", "pdf", "word"],
+    )
+    parser.add_argument("--output", help="Also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = format_results(run_benchmarks(args))
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
@@ -0,0 +1,95 @@
+def search_result_items(search_term_result):
+    """Return the hits of a search_excel, search_pdf_advanced or search_word result
+    as a list of {"reference", "text", "tables"} dictionaries."""
+    items = []
+
+    # search_excel returns whole rows (lists, row numbers in "row_nums") or snippets
+    # with a row number (dicts), search_excel_workbook returns dicts with the sheet name
+    row_nums = search_term_result.get("row_nums", [])
+    for hit_num, row in enumerate(search_term_result.get("search_term_result", [])):
+        if isinstance(row, dict):
+            row_num = row.get("row_num")
+            text = row["combined_text"] if "combined_text" in row else " | ".join(row["values"])
+        else:
+            row_num = row_nums[hit_num] if hit_num < len(row_nums) else None
+            text = " | ".join(row)
+        reference = f"row {row_num}" if row_num else f"row hit {hit_num + 1}"
+        if isinstance(row, dict) and row.get("sheet"):
+            reference = f"sheet {row['sheet']}, {reference}"
+        items.append({"reference": reference, "text": text})
+
+    # search_pdf_advanced and search_word return pages, paragraphs or tables
+    for result in search_term_result.get("extracted_data", []):
+        page_num = result["page_num"]
+        reference = page_num if isinstance(page_num, str) else f"page {page_num}"
+        items.append(
+            {
+                "reference": reference,
+                "text": result["combined_text"],
+                "tables": result.get("tables", []),
+            }
+        )
+    return items
+
+
+def aggregate_search_results(search_term, file_results):
+    """Merge the hits for one search term from several files into one evidence bundle.
+
+    file_results is a list of (file_name, search_term_result). Lines and table rows
+    already seen in an earlier file or page are dropped, so the same product data
+    found in a price list, spec sheet and marketing document is only kept once."""
+    seen_lines = set()
+    seen_rows = set()
+    sources = []
+    evidence = []
+
+    for file_name, search_term_result in file_results:
+        for item in search_result_items(search_term_result):
+            lines = []
+            for line in item["text"].splitlines():
+                key = " ".join(line.split()).lower()
+                if key and key not in seen_lines:
+                    seen_lines.add(key)
+                    lines.append(line.strip())
+
+            tables = []
+            for table in item.get("tables", []):
+                rows = []
+                for row in table["rows"]:
+                    key = tuple(sorted(row.items()))
+                    if key not in seen_rows:
+                        seen_rows.add(key)
+                        rows.append(row)
+                if rows:
+                    tables.append({"table_num": table["table_num"], "rows": rows})
+
+            if lines or tables:
+                evidence.append(
+                    {
+                        "source": file_name,
+                        "reference": item["reference"],
+                        "text": "\n".join(lines),
+                        "tables": tables,
+                    }
+                )
+                if file_name not in sources:
+                    sources.append(file_name)
+
+    return {"search_term": search_term, "sources": sources, "evidence": evidence}
+
+
+def format_evidence_bundle(bundle):
+    """Format an evidence bundle as text for the analysis step."""
+    formatted = f"Search term: {bundle['search_term']}\n"
+    formatted += f"Sources: {', '.join(bundle['sources'])}\n"
+    for item in bundle["evidence"]:
+        formatted += f"--- {item['source']}, {item['reference']} ---\n"
+        if item["text"]:
+            formatted += item["text"] + "\n"
+        for table in item["tables"]:
+            formatted += f"--- Table {table['table_num']} ---\n"
+            for row in table["rows"]:
+                formatted += (
+                    "; ".join(f"{key}: {value}" for key, value in row.items()) + "\n"
+                )
+    return formatted
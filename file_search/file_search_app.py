@@ -1,13 +1,11 @@
 import os
 import sys
 import json
-import pandas as pd
-import pdfplumber
-from docx import Document
-import fitz
+import queue
+import threading
 
 # Imports for the GUI elements (PyQt5)
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import (
     QWidget,
     QLabel,
@@ -18,15 +16,24 @@ from PyQt5.QtWidgets import (
     QMessageBox,
     QVBoxLayout,
     QListWidget,
+    QCheckBox,
+    QDoubleSpinBox,
+    QSpinBox,
 )
 
 # Add the project root to the python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Imports from other files in my project
-from file_search.search_excel import search_excel
-from file_search.search_pdf import search_pdf_advanced
-from file_search.search_word import search_word
+from file_search.file_sessions import open_file_session
+from file_search.search_pdf import PDF_MEMORY_LIMIT_MB, OCR_DPI, validate_page_range
+from file_search.trigram_index import FUZZY_THRESHOLD
+from file_search.snippets import SNIPPET_WINDOW
+from file_search.aggregate_results import (
+    aggregate_search_results,
+    format_evidence_bundle,
+    search_result_items,
+)
 from utils import SaveToFile
 from openai_handler.openaiDataBaseHandler import (
     OpenAIAnalyzer,
@@ -35,8 +42,15 @@ from openai_handler.openaiDataBaseHandler import (
 )
 from widgets.base_widget import BaseProcessingWidget
 
+# Number of search terms that may wait between two pipeline stages
+PIPELINE_QUEUE_SIZE = 2
+
 
 class FileSearchApp(BaseProcessingWidget):
+    # Signals used by the search pipeline threads to update the GUI
+    status_message = pyqtSignal(str)
+    search_finished = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         # Initialize handlers
@@ -45,17 +59,15 @@ class FileSearchApp(BaseProcessingWidget):
         self.db_datasearch = DatabaseSearch()
         self.save_search_to_excel = SaveToFile()
 
-        # Set search functions
-        self.search_excel = search_excel
-        self.search_pdf_advanced = search_pdf_advanced
-        self.search_word = search_word
-
         # Initialize variables
         self.inserted_brand = None
         self.inserted_productname = None
 
         self.init_ui()
 
+        self.status_message.connect(self.update_listbox)
+        self.search_finished.connect(self.on_search_finished)
+
     def init_ui(self):
         # Add title
         title = QLabel("Document Search and Analysis")
@@ -70,6 +82,7 @@ class FileSearchApp(BaseProcessingWidget):
         • Automatic database updates
         • Export search results
         • Multiple search terms support
+        • Select several files to merge the hits per search term
         """
         info_label = QLabel(info_text)
         info_label.setObjectName("info")
@@ -82,6 +95,12 @@ class FileSearchApp(BaseProcessingWidget):
         # Create metadata section
         self.create_metadata_section()
 
+        # Create Excel options section
+        self.create_excel_options_section()
+
+        # Create PDF options section
+        self.create_pdf_options_section()
+
         # Create action buttons
         self.create_buttons()
 
@@ -97,6 +116,30 @@ class FileSearchApp(BaseProcessingWidget):
         self.search_group_entry.setPlaceholderText("Enter search terms...")
         self.layout.addWidget(self.search_group_entry)
 
+        self.fuzzy_checkbox = QCheckBox(
+            "Fuzzy matching for article numbers and product names"
+        )
+        self.layout.addWidget(self.fuzzy_checkbox)
+
+        self.fuzzy_threshold_spinbox = QDoubleSpinBox()
+        self.fuzzy_threshold_spinbox.setRange(0.1, 1.0)
+        self.fuzzy_threshold_spinbox.setSingleStep(0.05)
+        self.fuzzy_threshold_spinbox.setValue(FUZZY_THRESHOLD)
+        self.fuzzy_threshold_spinbox.setPrefix("Fuzzy similarity threshold: ")
+        self.layout.addWidget(self.fuzzy_threshold_spinbox)
+
+        self.snippet_checkbox = QCheckBox(
+            "Snippet mode (only send the text around each hit to analysis)"
+        )
+        self.layout.addWidget(self.snippet_checkbox)
+
+        self.snippet_window_spinbox = QSpinBox()
+        self.snippet_window_spinbox.setRange(20, 5000)
+        self.snippet_window_spinbox.setSingleStep(50)
+        self.snippet_window_spinbox.setValue(SNIPPET_WINDOW)
+        self.snippet_window_spinbox.setPrefix("Characters around each hit: ")
+        self.layout.addWidget(self.snippet_window_spinbox)
+
     def create_metadata_section(self):
         # Brand input
         brand_label = QLabel("Brand Name:")
@@ -116,10 +159,59 @@ class FileSearchApp(BaseProcessingWidget):
         self.product_name_entry.setPlaceholderText("Enter product name (optional)")
         self.layout.addWidget(self.product_name_entry)
 
+    def create_excel_options_section(self):
+        excel_options_label = QLabel("Excel Options:")
+        excel_options_label.setObjectName("section-label")
+        self.layout.addWidget(excel_options_label)
+
+        self.all_sheets_checkbox = QCheckBox(
+            "Search all sheets (stops when every search term is found)"
+        )
+        self.layout.addWidget(self.all_sheets_checkbox)
+
+    def create_pdf_options_section(self):
+        pdf_options_label = QLabel("PDF Options:")
+        pdf_options_label.setObjectName("section-label")
+        self.layout.addWidget(pdf_options_label)
+
+        self.page_range_entry = QLineEdit()
+        self.page_range_entry.setPlaceholderText(
+            "Page range, e.g. 1-50, 75 (optional, all pages if empty)"
+        )
+        self.layout.addWidget(self.page_range_entry)
+
+        self.low_memory_checkbox = QCheckBox(
+            f"Low memory mode for large PDFs (max {PDF_MEMORY_LIMIT_MB} MB)"
+        )
+        self.layout.addWidget(self.low_memory_checkbox)
+
+        self.extract_tables_checkbox = QCheckBox(
+            "Extract tables on matching pages as structured rows"
+        )
+        self.layout.addWidget(self.extract_tables_checkbox)
+
+        self.remove_boilerplate_checkbox = QCheckBox(
+            "Remove headers, footers and page numbers repeated across pages"
+        )
+        self.remove_boilerplate_checkbox.setChecked(True)
+        self.layout.addWidget(self.remove_boilerplate_checkbox)
+
+        self.ocr_dpi_spinbox = QSpinBox()
+        self.ocr_dpi_spinbox.setRange(72, 600)
+        self.ocr_dpi_spinbox.setSingleStep(50)
+        self.ocr_dpi_spinbox.setValue(OCR_DPI)
+        self.ocr_dpi_spinbox.setPrefix("OCR resolution (DPI): ")
+        self.layout.addWidget(self.ocr_dpi_spinbox)
+
+        self.ocr_images_only_checkbox = QCheckBox(
+            "OCR only the images on each page (faster for text-layer PDFs)"
+        )
+        self.layout.addWidget(self.ocr_images_only_checkbox)
+
     def create_buttons(self):
-        search_button = QPushButton("Search Documents")
-        search_button.clicked.connect(self.open_file)
-        self.layout.addWidget(search_button)
+        self.search_button = QPushButton("Search Documents")
+        self.search_button.clicked.connect(self.open_file)
+        self.layout.addWidget(self.search_button)
 
         export_button = QPushButton("Export Results")
         export_button.clicked.connect(self.handle_save_to_file)
@@ -142,122 +234,201 @@ class FileSearchApp(BaseProcessingWidget):
         self.result_listbox.addItem(text)
         self.result_listbox.scrollToBottom()
 
+    def get_search_options(self):
+        """Collect the search options from the widget.
+        Returns None and shows a warning if an option is invalid."""
+        try:
+            page_range = validate_page_range(self.page_range_entry.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid page range", str(e))
+            return None
+
+        low_memory = self.low_memory_checkbox.isChecked()
+        return {
+            "fuzzy": self.fuzzy_checkbox.isChecked(),
+            "fuzzy_threshold": self.fuzzy_threshold_spinbox.value(),
+            "snippet_window": (
+                self.snippet_window_spinbox.value()
+                if self.snippet_checkbox.isChecked()
+                else None
+            ),
+            "page_range": page_range,
+            "low_memory": low_memory,
+            "max_memory_mb": PDF_MEMORY_LIMIT_MB if low_memory else None,
+            "extract_tables": self.extract_tables_checkbox.isChecked(),
+            "ocr_dpi": self.ocr_dpi_spinbox.value(),
+            "ocr_images_only": self.ocr_images_only_checkbox.isChecked(),
+            "all_sheets": self.all_sheets_checkbox.isChecked(),
+            "remove_boilerplate": self.remove_boilerplate_checkbox.isChecked(),
+        }
+
     def open_file(self):
         search_group = self.search_group_entry.text()
         if not search_group:
             self.update_listbox("Please enter search terms.")
             return
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select file", "", "Files (*.xlsx *.xls *.pdf *.docx *.doc)"
+        options = self.get_search_options()
+        if options is None:
+            return
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Select files", "", "Files (*.xlsx *.xls *.pdf *.docx *.doc)"
         )
-        if not file_path:
+        if not file_paths:
             self.update_listbox("No file selected.")
             return
         self.inserted_brand = self.brand_entry.text().strip() or None
         self.inserted_productname = self.product_name_entry.text().strip() or None
 
-        extension = file_path.split(".")[-1].lower()
-        search_term_results = []
+        search_terms = [term.strip() for term in search_group.split(",") if term.strip()]
+
+        # Run the search in the background so the GUI stays responsive
+        self.search_button.setEnabled(False)
+        self.update_listbox(
+            f"Searching {len(file_paths)} file(s) for {len(search_terms)} search term(s)..."
+        )
+        threading.Thread(
+            target=self.run_search_pipeline,
+            args=(file_paths, search_terms, options),
+            daemon=True,
+        ).start()
+
+    def on_search_finished(self):
+        self.search_button.setEnabled(True)
+        self.update_listbox("All search terms processed.")
+
+    def run_search_pipeline(self, file_paths, search_terms, options):
+        """Run extraction, analysis and database updates as a pipeline.
+        The next search terms are extracted while earlier ones are analyzed and written
+        to the database. Bounded queues keep extraction from running too far ahead."""
+        analysis_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        database_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stages = [
+            threading.Thread(
+                target=self.analysis_stage, args=(analysis_queue, database_queue)
+            ),
+            threading.Thread(target=self.database_stage, args=(database_queue,)),
+        ]
+        for stage in stages:
+            stage.start()
 
         try:
-            if extension in ["xlsx", "xls"]:
-                # Read Excel file and search for the search terms. If a search term is found, add the row to the search term result
-                # If a search term is not found, add the search term to the search_terms_not_found list.
-                # I do not send the search term who was not found to AI for analysis or for updating the database.
-                df = pd.read_excel(file_path, engine="openpyxl", na_filter=False)
-                for search_term in search_group.split(","):
-                    search_term_result = self.search_excel(df, search_term.strip())
-                    print(
-                        f"FileSearchApp open app recieved search_term_result from search_excel: {search_term_result}"
+            self.extraction_stage(file_paths, search_terms, options, analysis_queue)
+        except Exception as e:
+            self.status_message.emit(f"Error searching files: {str(e)}")
+            print(f"Error searching files: {str(e)}")
+        finally:
+            # None tells the next stage that no more search terms are coming
+            analysis_queue.put(None)
+            for stage in stages:
+                stage.join()
+            self.search_finished.emit()
+
+    def extraction_stage(self, file_paths, search_terms, options, analysis_queue):
+        """Search all files for one search term at a time and queue one merged
+        evidence bundle per search term for analysis."""
+        file_sessions = []
+        for file_path in file_paths:
+            try:
+                file_sessions.append(
+                    (
+                        os.path.basename(file_path),
+                        open_file_session(file_path, search_terms, options),
                     )
-                    # If the search was interrupted, skip the analysis and database update
-                    if search_term_result.get("search_interrupted"):
-                        self.update_listbox(
-                            f"{search_term.strip()} not found in Excel, continuing to next search term."
+                )
+            except Exception as e:
+                self.status_message.emit(
+                    f"Error opening {os.path.basename(file_path)}: {str(e)}"
+                )
+                print(f"Error opening file {file_path}: {str(e)}")
+
+        try:
+            for search_term in search_terms:
+                file_results = []
+                for file_name, file_session in file_sessions:
+                    try:
+                        search_term_result = file_session.search(search_term)
+                    except Exception as e:
+                        self.status_message.emit(
+                            f"Error searching {file_name}: {str(e)}"
                         )
+                        print(f"Error searching file {file_name}: {str(e)}")
                         continue
-
-                    # Analyze the search term result and update the database
-                    self.analyze_and_update_db(search_term.strip(), search_term_result)
                     print(
-                        f"FilesearchApp parsed and updated database for search_term: {search_term.strip()}"
-                    )
-                    search_term_results.append(
-                        (search_term.strip(), search_term_result)
+                        f"FileSearchApp received search_term_result for {search_term} from {file_name}: {search_term_result}"
                     )
-                    self.update_listbox(
-                        f"Search completed for {search_term.strip()} in Excel"
-                    )
-
-            elif extension == "pdf":
-                with pdfplumber.open(file_path) as pdf:
-                    doc = fitz.open(file_path)
-                    for search_term in search_group.split(","):
-                        search_term_result = self.search_pdf_advanced(
-                            pdf, doc, search_term.strip()
-                        )
-                        print(
-                            f"FileSearchApp open app recieved search_term_result from search_pdf_advanced: {search_term_result}"
-                        )
-                        # If the search was interrupted, skip the analysis and database update
-                        if search_term_result.get("search_interrupted"):
-                            self.update_listbox(
-                                f"{search_term.strip()} not found in PDF, continuing to next search term."
-                            )
-                            continue
-                        search_term_results.append(
-                            (search_term.strip(), search_term_result)
-                        )
-                        print(
-                            f"FilesearchApp parsed and updated database for search_term: {search_term.strip()}"
+                    if search_term_result.get("memory_limit_reached"):
+                        self.status_message.emit(
+                            f"Memory limit reached while searching {search_term}, narrow the page range."
                         )
-                        self.update_listbox(
-                            f"Search completed for {search_term.strip()} in PDF"
+                    # Search terms without hits are not sent to AI for analysis or for updating the database.
+                    if search_result_items(search_term_result):
+                        file_results.append((file_name, search_term_result))
+                    else:
+                        self.status_message.emit(
+                            f"{search_term} not found in {file_session.file_type} file {file_name}"
                         )
 
-            elif extension in ["docx", "doc"]:
-                doc = Document(file_path)
-                for search_term in search_group.split(","):
-                    search_term_result = self.search_word(doc, search_term.strip())
-                    print(
-                        f"FileSearchApp open app received search_term_result from search_word: {search_term_result}"
-                    )
-                    # If the search was interrupted, skip the analysis and database update
-                    if search_term_result.get("search_interrupted"):
-                        self.update_listbox(
-                            f"{search_term.strip()} not found in Word, continuing to next search term."
-                        )
-                        continue
-                    self.analyze_and_update_db(search_term.strip(), search_term_result)
-                    print(
-                        f"FilesearchApp parsed and updated database for search_term: {search_term.strip()}"
-                    )
-                    search_term_results.append(
-                        (search_term.strip(), search_term_result)
-                    )
-                    self.update_listbox(
-                        f"Search completed for {search_term.strip()} in Word"
+                bundle = aggregate_search_results(search_term, file_results)
+                if not bundle["evidence"]:
+                    self.status_message.emit(
+                        f"{search_term} not found in the selected files, continuing to next search term."
                     )
-
-        except Exception as e:
-            self.update_listbox(f"Error searching file: {str(e)}")
-            print(f"Error searching file: {str(e)}")
-
-    def analyze_and_update_db(self, search_term, search_term_result):
-        print(
-            f"Attempting to analyze and update database for search term: {search_term}"
-        )
-
-        # Analyze the search term result and update the database
+                    continue
+                analysis_queue.put((search_term, bundle))
+        finally:
+            for _, file_session in file_sessions:
+                file_session.close()
+
+    def analysis_stage(self, analysis_queue, database_queue):
+        """Analyze the queued evidence bundles and queue the analyses for the database."""
+        while True:
+            item = analysis_queue.get()
+            if item is None:
+                database_queue.put(None)
+                return
+            search_term, bundle = item
+            try:
+                analysis = self.analyze_search_term_result(
+                    search_term, format_evidence_bundle(bundle)
+                )
+                database_queue.put((search_term, bundle["sources"], analysis))
+            except Exception as e:
+                self.status_message.emit(f"Error analyzing {search_term}: {str(e)}")
+                print(f"Error analyzing {search_term}: {str(e)}")
+
+    def database_stage(self, database_queue):
+        """Write the queued analyses to the database."""
+        while True:
+            item = database_queue.get()
+            if item is None:
+                return
+            search_term, sources, analysis = item
+            try:
+                self.db_handler.update_database(search_term, analysis)
+                self.status_message.emit(f"Database updated for {search_term}")
+                print(
+                    f"FilesearchApp parsed and updated database for search_term: {search_term}"
+                )
+                self.status_message.emit(
+                    f"Search completed for {search_term} in {', '.join(sources)}"
+                )
+            except Exception as e:
+                self.status_message.emit(
+                    f"Error updating database for {search_term}: {str(e)}"
+                )
+                print(f"Error updating database for {search_term}: {str(e)}")
+
+    def analyze_search_term_result(self, search_term, search_term_result):
+        print(f"Attempting to analyze search term: {search_term}")
+
+        # Analyze the search term result
         analysis = self.analyzer.analyze_text(search_term_result)
 
         if self.inserted_brand:
             analysis.brand = self.inserted_brand
         if self.inserted_productname:
             analysis.product_name = self.inserted_productname
-
-        self.db_handler.update_database(search_term, analysis)
-        self.update_listbox(f"Database updated for {search_term}")
+        return analysis
 
     def handle_save_to_file(self):
         search_group = self.search_group_entry.text()
@@ -0,0 +1,139 @@
+import os
+import pandas as pd
+from docx import Document
+
+from file_search.search_excel import (
+    search_excel,
+    search_excel_workbook,
+    build_excel_index,
+    normalize_dataframe,
+)
+from file_search.search_pdf import (
+    search_pdf_advanced,
+    SharedPdf,
+    build_pdf_index,
+    detect_boilerplate_lines,
+)
+from file_search.search_word import search_word, build_word_index
+
+
+class ExcelFileSession:
+    """An Excel file opened for a search session. The first sheet is read and
+    normalized once, or all sheets are searched for every term on first use."""
+
+    file_type = "Excel"
+
+    def __init__(self, file_path, search_terms, options):
+        self.file_path = file_path
+        self.search_terms = search_terms
+        self.options = options
+        self.workbook_results = None
+
+        if not options["all_sheets"]:
+            # Only the first sheet
+            self.df = pd.read_excel(file_path, engine="openpyxl", na_filter=False)
+            self.df_normalized = normalize_dataframe(self.df)
+            self.fuzzy_index = build_excel_index(self.df) if options["fuzzy"] else None
+
+    def search(self, search_term):
+        if self.options["all_sheets"]:
+            if self.workbook_results is None:
+                self.workbook_results = search_excel_workbook(
+                    self.file_path,
+                    self.search_terms,
+                    fuzzy=self.options["fuzzy"],
+                    fuzzy_threshold=self.options["fuzzy_threshold"],
+                    snippet_window=self.options["snippet_window"],
+                )
+            return self.workbook_results[search_term]
+
+        return search_excel(
+            self.df,
+            search_term,
+            fuzzy_index=self.fuzzy_index,
+            fuzzy_threshold=self.options["fuzzy_threshold"],
+            snippet_window=self.options["snippet_window"],
+            df_normalized=self.df_normalized,
+        )
+
+    def close(self):
+        pass
+
+
+class PdfFileSession:
+    """A PDF opened once for a search session and shared by pdfplumber and PyMuPDF."""
+
+    file_type = "PDF"
+
+    def __init__(self, file_path, search_terms, options):
+        self.options = options
+        self.shared_pdf = SharedPdf(file_path)
+        doc = self.shared_pdf.doc
+        self.fuzzy_index = (
+            build_pdf_index(doc, options["page_range"]) if options["fuzzy"] else None
+        )
+        self.boilerplate_lines = (
+            detect_boilerplate_lines(doc, options["page_range"])
+            if options["remove_boilerplate"]
+            else None
+        )
+
+    def search(self, search_term):
+        return search_pdf_advanced(
+            self.shared_pdf.pdf,
+            self.shared_pdf.doc,
+            search_term,
+            page_range=self.options["page_range"],
+            low_memory=self.options["low_memory"],
+            max_memory_mb=self.options["max_memory_mb"],
+            fuzzy_index=self.fuzzy_index,
+            fuzzy_threshold=self.options["fuzzy_threshold"],
+            snippet_window=self.options["snippet_window"],
+            extract_tables=self.options["extract_tables"],
+            ocr_dpi=self.options["ocr_dpi"],
+            ocr_images_only=self.options["ocr_images_only"],
+            boilerplate_lines=self.boilerplate_lines,
+        )
+
+    def close(self):
+        self.shared_pdf.close()
+
+
+class WordFileSession:
+    """A Word document opened once for a search session."""
+
+    file_type = "Word"
+
+    def __init__(self, file_path, search_terms, options):
+        self.options = options
+        self.doc = Document(file_path)
+        self.fuzzy_index = build_word_index(self.doc) if options["fuzzy"] else None
+
+    def search(self, search_term):
+        return search_word(
+            self.doc,
+            search_term,
+            fuzzy_index=self.fuzzy_index,
+            fuzzy_threshold=self.options["fuzzy_threshold"],
+            snippet_window=self.options["snippet_window"],
+        )
+
+    def close(self):
+        pass
+
+
+FILE_SESSIONS = {
+    "xlsx": ExcelFileSession,
+    "xls": ExcelFileSession,
+    "pdf": PdfFileSession,
+    "docx": WordFileSession,
+    "doc": WordFileSession,
+}
+
+
+def open_file_session(file_path, search_terms, options):
+    """Open a file for searching all search terms. Raises ValueError for unsupported file types."""
+    extension = os.path.splitext(file_path)[1].lstrip(".").lower()
+    if extension not in FILE_SESSIONS:
+        raise ValueError(f"Unsupported file type: {file_path}")
+    return FILE_SESSIONS[extension](file_path, search_terms, options)
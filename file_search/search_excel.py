@@ -1,6 +1,14 @@
+import os
 import pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
 from utils import clean_searchresults_from_filesearches
+from file_search.trigram_index import TrigramIndex, FUZZY_THRESHOLD
+from file_search.snippets import snippet_text
+
+# Number of processes loading workbook sheets in parallel
+EXCEL_MAX_WORKERS = min(os.cpu_count() or 1, 4)
 
 
 def normalize_text(text):
@@ -11,35 +19,94 @@ def normalize_text(text):
     return text.strip()
 
 
-def search_excel(df, search_term):
+def normalize_dataframe(df):
+    """Convert all cells to strings and normalize them for searching."""
+    return df.astype(str).apply(lambda x: x.map(normalize_text))
+
+
+def list_excel_sheets(file_path):
+    """List the sheet names of a workbook without loading the sheets."""
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def load_excel_sheet(file_path, sheet_name):
+    """Read one sheet of a workbook. Returns the sheet and its normalized copy."""
+    df = pd.read_excel(
+        file_path, sheet_name=sheet_name, engine="openpyxl", na_filter=False
+    )
+    return df, normalize_dataframe(df)
+
+
+def build_excel_index(df):
+    """Build a trigram index over the rows of the DataFrame, keyed by row index."""
+    index = TrigramIndex()
+    for row_index, row in df.astype(str).iterrows():
+        index.add_document(row_index, " ".join(row.values))
+    return index
+
+
+def search_excel(
+    df,
+    search_term,
+    fuzzy_index=None,
+    fuzzy_threshold=FUZZY_THRESHOLD,
+    snippet_window=None,
+    df_normalized=None,
+):
+    """Search the rows of the DataFrame for the search term.
+    If a trigram index is given, rows with a fuzzy match are also returned.
+    snippet_window returns the Excel row number and the text around each hit instead of the whole row.
+    Whole rows are returned as lists, with their Excel row numbers in "row_nums".
+    df_normalized is the result of normalize_dataframe(df), pass it to avoid normalizing for every term."""
     try:
         print(
             f"search_excel: Processing DataFrame. Rows: {df.shape[0]}, Columns: {df.shape[1]}"
         )
 
-        # Convert all columns to string
-        df_str = df.astype(str)
-
-        # Fix: Apply normalize_text to all cells in the DataFrame
-        df_str = df_str.apply(lambda x: x.map(normalize_text))
+        # Convert all cells to normalized strings
+        df_str = df_normalized if df_normalized is not None else normalize_dataframe(df)
 
         search_term_result = []
+        row_nums = []  # Excel row numbers of the whole-row hits
         search_terms_not_found = []
 
         # Normalize search term
         normalized_search_term = normalize_text(search_term)
+        fuzzy_rows = (
+            fuzzy_index.matching_documents(search_term, fuzzy_threshold)
+            if fuzzy_index
+            else set()
+        )
 
         for index, row in df_str.iterrows():
             # Filter out empty values and join row values into a single string
             row_values = filter(None, row.values)
             # Join all row values into a single string for the search
             row_str = " ".join(row_values)  # Filter out empty or None values here
-            if re.search(r"\b" + re.escape(normalized_search_term) + r"\b", row_str):
+            if index in fuzzy_rows or re.search(
+                r"\b" + re.escape(normalized_search_term) + r"\b", row_str
+            ):
                 # Append non-empty row values as a list
                 non_empty_values = [value for value in row.values if value.strip()]
                 # Clean the search results from file searches
                 cleaned_values = clean_searchresults_from_filesearches(non_empty_values)
-                search_term_result.append(cleaned_values)
+                if snippet_window:
+                    search_term_result.append(
+                        {
+                            # Excel row number, the header is row 1
+                            "row_num": index + 2,
+                            "combined_text": snippet_text(
+                                " | ".join(cleaned_values), search_term, snippet_window
+                            ),
+                        }
+                    )
+                else:
+                    search_term_result.append(cleaned_values)
+                    row_nums.append(index + 2)
 
         if not search_term_result:
             search_terms_not_found.append(search_term)
@@ -51,6 +118,7 @@ def search_excel(df, search_term):
 
         return {
             "search_term_result": search_term_result,
+            "row_nums": row_nums,
             "keywords_not_found": search_terms_not_found,
             "search_interrupted": False,
         }
@@ -62,3 +130,85 @@ def search_excel(df, search_term):
             "keywords_not_found": [search_term],
             "search_interrupted": True,
         }
+
+
+def search_excel_workbook(
+    file_path,
+    search_terms,
+    fuzzy=False,
+    fuzzy_threshold=FUZZY_THRESHOLD,
+    snippet_window=None,
+    max_workers=EXCEL_MAX_WORKERS,
+):
+    """Search all sheets of a workbook for the search terms.
+
+    Sheets are loaded and normalized lazily, max_workers at a time in separate
+    processes, and loading stops as soon as every search term has been found.
+    Returns {search_term: search_term_result} like search_excel. Whole-row hits are
+    returned as {"sheet", "row_num", "values"} so every hit keeps its sheet and row."""
+    sheet_names = list_excel_sheets(file_path)
+    print(f"search_excel_workbook: {len(sheet_names)} sheets in {file_path}")
+
+    rows_found = {search_term: [] for search_term in search_terms}
+    executor = (
+        ProcessPoolExecutor(max_workers=max_workers)
+        if max_workers > 1 and len(sheet_names) > 1
+        else None
+    )
+    batch_size = max_workers if executor else 1
+
+    try:
+        for start in range(0, len(sheet_names), batch_size):
+            batch = sheet_names[start : start + batch_size]
+            if executor:
+                loaded_sheets = executor.map(
+                    load_excel_sheet, [file_path] * len(batch), batch
+                )
+            else:
+                loaded_sheets = (
+                    load_excel_sheet(file_path, sheet_name) for sheet_name in batch
+                )
+
+            for sheet_name, (df, df_normalized) in zip(batch, loaded_sheets):
+                fuzzy_index = build_excel_index(df) if fuzzy else None
+                for search_term in search_terms:
+                    search_term_result = search_excel(
+                        df,
+                        search_term,
+                        fuzzy_index=fuzzy_index,
+                        fuzzy_threshold=fuzzy_threshold,
+                        snippet_window=snippet_window,
+                        df_normalized=df_normalized,
+                    )
+                    row_nums = search_term_result.get("row_nums", [])
+                    for hit_num, row in enumerate(
+                        search_term_result["search_term_result"]
+                    ):
+                        if isinstance(row, dict):
+                            row["sheet"] = sheet_name
+                        else:
+                            # Keep the sheet and Excel row number of whole-row hits
+                            row = {
+                                "sheet": sheet_name,
+                                "row_num": row_nums[hit_num],
+                                "values": row,
+                            }
+                        rows_found[search_term].append(row)
+
+            if all(rows_found.values()):
+                print(
+                    f"search_excel_workbook: All search terms found, skipping {len(sheet_names) - start - len(batch)} sheets"
+                )
+                break
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    return {
+        search_term: {
+            "search_term_result": rows,
+            "keywords_not_found": [] if rows else [search_term],
+            "search_interrupted": not rows,
+        }
+        for search_term, rows in rows_found.items()
+    }
@@ -2,7 +2,15 @@ import pdfplumber
 import pytesseract
 from PIL import Image
 import fitz
+import gc
+import math
+import mmap
+import re
 import logging
+import psutil
+from file_search.trigram_index import TrigramIndex, FUZZY_THRESHOLD
+from file_search.snippets import snippet_text
+from collections import Counter
 
 # Set the logging level for every library and everything else to WARNING
 logging.getLogger("pdfplumber").setLevel(logging.WARNING)
@@ -12,6 +20,24 @@ logging.getLogger("pytesseract").setLevel(logging.WARNING)
 logging.getLogger("pdf2image").setLevel(logging.WARNING)
 logging.getLogger("pdf2image").propagate = False
 
+# Default resident memory cap (MB) used by the bounded-memory PDF mode
+PDF_MEMORY_LIMIT_MB = 2048
+
+# Default resolution pages are rasterized at for OCR
+OCR_DPI = 300
+
+# Share of pages a line must appear on to be treated as header, footer or legal boilerplate
+BOILERPLATE_PAGE_RATIO = 0.6
+BOILERPLATE_MIN_PAGES = 3
+# Page numbers with an explicit prefix ("Sida 3", "Page 3 of 40") or in the "3 of 40" form
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^(page|sida|seite|p\.)\s*\d+(\s*(/|of|av|von)\s*\d+)?$"
+    r"|^\d+\s*(of|av|von)\s*\d+$"
+)
+# Bare page numbers ("3", "3/40"), only trusted on the first or last line of a page,
+# elsewhere number-only lines are usually prices, weights, EANs or article numbers
+BARE_PAGE_NUMBER_PATTERN = re.compile(r"^\d{1,4}(\s*/\s*\d{1,4})?$")
+
 
 # Function to clean text and remove duplicates
 def function_clean_text(text):
@@ -25,7 +51,276 @@ def function_clean_text(text):
     return "\n".join(filtered_lines)
 
 
-def search_pdf_advanced(pdf, doc, search_term):
+def normalize_boilerplate_line(line, page_edge=False):
+    """Normalize a line for boilerplate detection. Page numbers like "Page 3 of 40"
+    are all normalized to the same value so they count as one repeated line.
+    Bare numbers only count as page numbers on the first or last line of a page (page_edge)."""
+    line = " ".join(line.split()).lower()
+    if PAGE_NUMBER_PATTERN.match(line) or (
+        page_edge and BARE_PAGE_NUMBER_PATTERN.match(line)
+    ):
+        return "<page number>"
+    return line
+
+
+def normalized_page_lines(text):
+    """Return the normalized non-empty lines of a page text as (original line, normalized line)."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    last_index = len(lines) - 1
+    return [
+        (line, normalize_boilerplate_line(line, index in (0, last_index)))
+        for index, line in enumerate(lines)
+    ]
+
+
+def detect_boilerplate_lines(
+    doc,
+    page_range=None,
+    min_page_ratio=BOILERPLATE_PAGE_RATIO,
+    min_pages=BOILERPLATE_MIN_PAGES,
+):
+    """Find the lines repeated on many pages of the document, like headers, footers,
+    legal text and page numbers, using the PyMuPDF text layer.
+    Returns a set of normalized lines for function_remove_boilerplate."""
+    page_indexes = parse_page_range(page_range, doc.page_count)
+    if len(page_indexes) < min_pages:
+        return set()
+
+    line_counts = Counter()
+    for page_num in page_indexes:
+        page_text = doc.load_page(page_num).get_text("text")
+        line_counts.update(
+            {normalized_line for _, normalized_line in normalized_page_lines(page_text)}
+        )
+
+    min_count = max(2, math.ceil(min_page_ratio * len(page_indexes)))
+    boilerplate_lines = {line for line, count in line_counts.items() if count >= min_count}
+    print(f"detect_boilerplate_lines: {len(boilerplate_lines)} repeated lines found")
+    return boilerplate_lines
+
+
+def function_remove_boilerplate(text, boilerplate_lines, search_terms=()):
+    """Remove the lines found by detect_boilerplate_lines from the text of one page.
+    Lines containing one of the search terms are always kept."""
+    return "\n".join(
+        line
+        for line, normalized_line in normalized_page_lines(text)
+        if normalized_line not in boilerplate_lines
+        or any(term in line.lower() for term in search_terms)
+    )
+
+
+class SharedPdf:
+    """A PDF opened once for both pdfplumber and PyMuPDF for a whole search session.
+
+    pdfplumber parses a read-only memory mapping of the file and PyMuPDF opens the
+    file by path and reads it on demand, so the file is never copied into memory
+    as a whole and resident memory stays close to the pages actually used.
+
+    Usage:
+        with SharedPdf(file_path) as shared_pdf:
+            search_pdf_advanced(shared_pdf.pdf, shared_pdf.doc, search_term)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.mapping = None
+        self.pdf = None
+        self.doc = None
+        try:
+            with open(file_path, "rb") as f:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.pdf = pdfplumber.open(self.mapping)
+            self.doc = fitz.open(file_path, filetype="pdf")
+        except Exception:
+            # Release whatever was opened before the failure
+            self.close()
+            raise
+
+    def close(self):
+        if self.doc is not None:
+            self.doc.close()
+        if self.pdf is not None:
+            self.pdf.close()
+        if self.mapping is not None:
+            self.mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def ocr_page(doc, page_num, dpi=OCR_DPI, images_only=False):
+    """OCR a page rasterized in grayscale by PyMuPDF at the given DPI.
+    images_only limits OCR to the embedded image regions of the page."""
+    page = doc.load_page(page_num)
+    if images_only:
+        clips = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+        clips = [clip for clip in clips if not clip.is_empty]
+    else:
+        clips = [None]
+
+    texts = []
+    for clip in clips:
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, clip=clip, alpha=False)
+        # Wrap the pixmap samples without copying them
+        image = Image.frombuffer(
+            "L",
+            (pixmap.width, pixmap.height),
+            pixmap.samples_mv,
+            "raw",
+            "L",
+            pixmap.stride,
+            1,
+        )
+        texts.append(pytesseract.image_to_string(image))
+    return "\n".join(texts)
+
+
+def function_clean_cell(cell):
+    """Collapse whitespace in a table cell. Empty cells become an empty string."""
+    return " ".join(str(cell).split()) if cell is not None else ""
+
+
+def extract_spec_tables(page):
+    """Detect the tables on a pdfplumber page and return them as structured rows.
+    Two-column tables are read as key/value spec rows, wider tables use
+    the first row as header and return one dictionary per row."""
+    tables = []
+    for table_num, table in enumerate(page.extract_tables()):
+        rows = [
+            [function_clean_cell(cell) for cell in row]
+            for row in table
+            if any(function_clean_cell(cell) for cell in row)
+        ]
+        if not rows:
+            continue
+
+        if max(len(row) for row in rows) == 2:
+            structured_rows = [{row[0]: row[1]} for row in rows if row[0]]
+        else:
+            header = [
+                column or f"column_{column_num + 1}"
+                for column_num, column in enumerate(rows[0])
+            ]
+            structured_rows = [
+                {key: value for key, value in zip(header, row) if value}
+                for row in rows[1:]
+            ]
+
+        if structured_rows:
+            tables.append({"table_num": table_num + 1, "rows": structured_rows})
+    return tables
+
+
+def parse_page_range_part(part):
+    """Parse one part of a page range like "5", "1-20", "3-" or "-10" into (start, end).
+    An open end is None. Raises ValueError for anything else."""
+    match = re.fullmatch(r"(\d*)\s*-\s*(\d*)|(\d+)", part)
+    if not match or part == "-":
+        raise ValueError(
+            f"Invalid page range '{part}', use page numbers like 1-20, 35 or 40-"
+        )
+    if match.group(3):
+        start = end = int(match.group(3))
+    else:
+        start = int(match.group(1)) if match.group(1) else 1
+        end = int(match.group(2)) if match.group(2) else None
+    if start < 1:
+        raise ValueError(f"Invalid page range '{part}', pages are numbered from 1")
+    if end is not None and end < start:
+        raise ValueError(f"Invalid page range '{part}', the first page is after the last")
+    return start, end
+
+
+def validate_page_range(page_range):
+    """Check a page range entered by the user. Returns the stripped page range or None
+    if it is empty. Raises ValueError with a message for the user if it is invalid."""
+    if not page_range or not str(page_range).strip():
+        return None
+    for part in str(page_range).split(","):
+        if part.strip():
+            parse_page_range_part(part.strip())
+    return str(page_range).strip()
+
+
+def parse_page_range(page_range, page_count):
+    """Parse a page range like "1-20, 35, 40-" into sorted zero-based page indexes.
+    An empty page range selects every page. Pages outside the document are ignored.
+    Raises ValueError for an invalid page range, see validate_page_range."""
+    if not page_range or not str(page_range).strip():
+        return list(range(page_count))
+
+    page_indexes = set()
+    for part in str(page_range).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = parse_page_range_part(part)
+        end = page_count if end is None else end
+        for page_number in range(max(start, 1), min(end, page_count) + 1):
+            page_indexes.add(page_number - 1)
+    return sorted(page_indexes)
+
+
+def resident_memory_mb():
+    """Return the resident memory of the current process in MB."""
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def release_page_cache(pdf, page):
+    """Drop the objects pdfplumber and pdfminer have cached for a processed page."""
+    flush = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+    if flush:
+        flush()
+    # pdfminer keeps every parsed PDF object of the document in these dictionaries
+    for cache_name in ("_cached_objs", "_parsed_objs"):
+        cache = getattr(getattr(pdf, "doc", None), cache_name, None)
+        if isinstance(cache, dict):
+            cache.clear()
+
+
+def release_memory():
+    """Free the PyMuPDF object store and collect garbage."""
+    fitz.TOOLS.store_shrink(100)
+    gc.collect()
+
+
+def build_pdf_index(doc, page_range=None):
+    """Build a trigram index over the PyMuPDF text layer, keyed by zero-based page index."""
+    index = TrigramIndex()
+    for page_num in parse_page_range(page_range, doc.page_count):
+        index.add_document(page_num, doc.load_page(page_num).get_text("text"))
+    return index
+
+
+def search_pdf_advanced(
+    pdf,
+    doc,
+    search_term,
+    page_range=None,
+    low_memory=False,
+    max_memory_mb=None,
+    fuzzy_index=None,
+    fuzzy_threshold=FUZZY_THRESHOLD,
+    snippet_window=None,
+    extract_tables=False,
+    ocr_dpi=OCR_DPI,
+    ocr_images_only=False,
+    boilerplate_lines=None,
+):
+    """Search the pages of a PDF for the search terms.
+
+    page_range restricts the search to pages like "1-20, 35".
+    low_memory releases the page caches of pdfplumber and PyMuPDF after each page,
+    and max_memory_mb stops the search if resident memory stays above the limit.
+    If a trigram index is given, pages with a fuzzy match are also returned.
+    snippet_window returns only the text around each hit instead of the whole page.
+    extract_tables adds the tables of matching pages as structured rows.
+    ocr_dpi and ocr_images_only control how pages are rasterized for OCR.
+    boilerplate_lines from detect_boilerplate_lines are stripped from the page text."""
     print("search_pdf_advanced function started.")
     if not isinstance(search_term, list):
         search_term = [search_term]
@@ -34,36 +329,72 @@ def search_pdf_advanced(pdf, doc, search_term):
     extracted_data = []
     search_terms_not_found = {}
     search_interrupted = False
+    memory_limit_reached = False
+
+    # An invalid page range is an error, not a search without hits
+    page_indexes = parse_page_range(page_range, len(pdf.pages))
 
     try:
         print(f"search_pdf_advanced: Processing PDF with {len(pdf.pages)} pages")
 
-        for page_num, page in enumerate(pdf.pages):
+        # Pages with a fuzzy match for each search term
+        fuzzy_pages = {
+            str(term).strip().lower(): (
+                fuzzy_index.matching_documents(term, fuzzy_threshold)
+                if fuzzy_index
+                else set()
+            )
+            for term in search_term
+        }
+
+        # Lines containing a search term are never removed as boilerplate
+        lowercase_terms = [str(term).strip().lower() for term in search_term]
+
+        for page_num in page_indexes:
+            page = pdf.pages[page_num]
             print(f"search_pdf_advanced: Processing page {page_num + 1}")
             found_text = ""
             missing_terms = []
 
+            # Extract text using different methods
+            text_sources = {
+                "pdfplumber": lambda: page.extract_text(),
+                "pytesseract": lambda: ocr_page(
+                    doc, page_num, dpi=ocr_dpi, images_only=ocr_images_only
+                ),
+                "pymupdf": lambda: doc.load_page(page_num).get_text("text"),
+            }
+            # Each source is extracted once per page and reused for every term
+            page_texts = {}
+
             for term in search_term:
                 term = str(term).strip().lower()
                 term_found = False
 
-                # Extract text using different methods
-                text_sources = {
-                    "pdfplumber": lambda: page.extract_text(),
-                    "pytesseract": lambda: pytesseract.image_to_string(
-                        page.to_image().original
-                    ),
-                    "pymupdf": lambda: doc.load_page(page_num).get_text("text"),
-                }
-
                 for source_name, extract_func in text_sources.items():
-                    try:
-                        text = extract_func()
-                        if text and term in text.lower():
-                            found_text += f"{source_name}:\n{text}\n\n"
-                            term_found = True
-                    except Exception as e:
-                        print(f"{source_name} error on page {page_num + 1}: {e}")
+                    if source_name not in page_texts:
+                        try:
+                            page_texts[source_name] = extract_func()
+                        except Exception as e:
+                            page_texts[source_name] = None
+                            print(f"{source_name} error on page {page_num + 1}: {e}")
+                    text = page_texts[source_name]
+                    if text and term in text.lower():
+                        if boilerplate_lines:
+                            text = function_remove_boilerplate(
+                                text, boilerplate_lines, lowercase_terms
+                            )
+                        found_text += f"{source_name}:\n{text}\n\n"
+                        term_found = True
+
+                if not term_found and page_num in fuzzy_pages[term]:
+                    text = doc.load_page(page_num).get_text("text")
+                    if boilerplate_lines:
+                        text = function_remove_boilerplate(
+                            text, boilerplate_lines, lowercase_terms
+                        )
+                    found_text += f"pymupdf (fuzzy match):\n{text}\n\n"
+                    term_found = True
 
                 if not term_found:
                     missing_terms.append(term)
@@ -72,22 +403,46 @@ def search_pdf_advanced(pdf, doc, search_term):
                 print(
                     f"search_pdf_advanced: Found match for '{term}' on page {page_num + 1}"
                 )
-                extracted_data.append(
-                    {
-                        "page_num": page_num + 1,
-                        "combined_text": function_clean_text(found_text),
-                    }
-                )
+                combined_text = function_clean_text(found_text)
+                if snippet_window:
+                    combined_text = snippet_text(
+                        combined_text, search_term, snippet_window
+                    )
+                page_result = {
+                    "page_num": page_num + 1,
+                    "combined_text": combined_text,
+                }
+                if extract_tables:
+                    try:
+                        page_result["tables"] = extract_spec_tables(page)
+                    except Exception as e:
+                        print(f"Table extraction error on page {page_num + 1}: {e}")
+                extracted_data.append(page_result)
 
             if missing_terms:
                 search_terms_not_found[page_num + 1] = missing_terms
                 search_interrupted = True
 
+            if low_memory:
+                release_page_cache(pdf, page)
+                fitz.TOOLS.store_shrink(100)
+
+            if max_memory_mb and resident_memory_mb() > max_memory_mb:
+                release_memory()
+                if resident_memory_mb() > max_memory_mb:
+                    print(
+                        f"search_pdf_advanced: Memory limit of {max_memory_mb} MB reached on page {page_num + 1}, stopping search"
+                    )
+                    memory_limit_reached = True
+                    search_interrupted = True
+                    break
+
         print("search_pdf_advanced: PDF processing complete")
         return {
             "extracted_data": extracted_data,
             "keywords_not_found": search_terms_not_found,
             "search_interrupted": search_interrupted,
+            "memory_limit_reached": memory_limit_reached,
         }
 
     except Exception as e:
@@ -114,6 +469,13 @@ def process_combined_results(extracted_data):
             # Safely access the dictionary elements
             full_extracted_search_results += f"--- Page {result['page_num']} ---\n"
             full_extracted_search_results += result["combined_text"] + "\n"
+            for table in result.get("tables", []):
+                full_extracted_search_results += f"--- Table {table['table_num']} ---\n"
+                for row in table["rows"]:
+                    full_extracted_search_results += (
+                        "; ".join(f"{key}: {value}" for key, value in row.items())
+                        + "\n"
+                    )
         else:
             # If the result is not in the expected format, log an error and continue
             print(f"Unexpected result format: {result}")
@@ -1,7 +1,30 @@
 from docx import Document
+from file_search.trigram_index import TrigramIndex, FUZZY_THRESHOLD
+from file_search.snippets import snippet_text
 
 
-def search_word(doc, search_term):
+def build_word_index(doc):
+    """Build a trigram index over the paragraphs and table cells of the document.
+    Paragraphs are keyed by paragraph number and cells by (table, row, cell)."""
+    index = TrigramIndex()
+    for page_num, para in enumerate(doc.paragraphs):
+        index.add_document(page_num + 1, para.text)
+    for table_num, table in enumerate(doc.tables):
+        for row_num, row in enumerate(table.rows):
+            for cell_num, cell in enumerate(row.cells):
+                index.add_document(
+                    (f"table_{table_num + 1}", row_num, cell_num), cell.text
+                )
+    return index
+
+
+def search_word(
+    doc,
+    search_term,
+    fuzzy_index=None,
+    fuzzy_threshold=FUZZY_THRESHOLD,
+    snippet_window=None,
+):
     print("search_word function started.")
     extracted_data = []
     search_terms_not_found = {}
@@ -11,18 +34,30 @@ def search_word(doc, search_term):
         search_term = [search_term]
     print(f"search_word: Searching for search terms: {search_term}")
 
+    # Paragraphs and table cells with a fuzzy match for each search term
+    fuzzy_matches = {
+        str(term).lower(): (
+            fuzzy_index.matching_documents(term, fuzzy_threshold)
+            if fuzzy_index
+            else set()
+        )
+        for term in search_term
+    }
+
     for page_num, para in enumerate(doc.paragraphs):
         missing_terms = []
         found_text = ""
 
         for term in search_term:
             term = str(term).lower()
-            if term in para.text.lower():
+            if term in para.text.lower() or page_num + 1 in fuzzy_matches[term]:
                 found_text = para.text
             else:
                 missing_terms.append(term)
 
         if found_text:
+            if snippet_window:
+                found_text = snippet_text(found_text, search_term, snippet_window)
             extracted_data.append(
                 {"page_num": page_num + 1, "combined_text": found_text}
             )
@@ -37,20 +72,24 @@ def search_word(doc, search_term):
         missing_terms = []
         found_text = ""
 
-        for row in table.rows:
-            for cell in row.cells:
+        for row_num, row in enumerate(table.rows):
+            for cell_num, cell in enumerate(row.cells):
                 for term in search_term:
                     term = str(term).lower()
-                    if term in cell.text.lower():
+                    cell_id = (f"table_{table_num + 1}", row_num, cell_num)
+                    if term in cell.text.lower() or cell_id in fuzzy_matches[term]:
                         found_text += cell.text + "\n"
                     else:
                         missing_terms.append(term)
 
         if found_text:
+            found_text = found_text.strip()
+            if snippet_window:
+                found_text = snippet_text(found_text, search_term, snippet_window)
             extracted_data.append(
                 {
                     "page_num": f"table_{table_num + 1}",
-                    "combined_text": found_text.strip(),
+                    "combined_text": found_text,
                 }
             )
             print(f"search_word: Found match in table {table_num + 1}")
@@ -0,0 +1,73 @@
+import re
+from file_search.trigram_index import compact_text, fold_text
+
+# Default number of characters kept on each side of a hit in snippet mode
+SNIPPET_WINDOW = 200
+SNIPPET_SEPARATOR = "\n...\n"
+
+
+def term_pattern(search_term):
+    """Compile a case-insensitive pattern for the search term that also matches
+    when spaces or punctuation are inserted, e.g. "NF0A3XYZ" matches "NF 0A3-XYZ"."""
+    characters = compact_text(search_term)
+    if not characters:
+        return None
+    return re.compile(
+        r"[\W_]*".join(re.escape(character) for character in characters),
+        re.IGNORECASE,
+    )
+
+
+def fold_text_with_positions(text):
+    """Fold the text like fold_text and return (folded text, position in the text of
+    every folded character), so hits in the folded text map back to the original text."""
+    folded_characters = []
+    positions = []
+    for position, character in enumerate(text):
+        folded = fold_text(character)
+        folded_characters.append(folded)
+        positions.extend([position] * len(folded))
+    return "".join(folded_characters), positions
+
+
+def merge_windows(hits, text_length, window=SNIPPET_WINDOW):
+    """Widen each (start, end) hit by the window and merge overlapping windows."""
+    merged = []
+    for start, end in sorted(hits):
+        start, end = max(start - window, 0), min(end + window, text_length)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def extract_snippets(text, search_terms, window=SNIPPET_WINDOW):
+    """Return the text windows around every hit of the search terms, overlapping windows merged."""
+    if not isinstance(search_terms, list):
+        search_terms = [search_terms]
+
+    # The term pattern is folded (no diacritics), so match it against the folded text
+    folded_text, positions = fold_text_with_positions(text)
+    hits = []
+    for search_term in search_terms:
+        pattern = term_pattern(search_term)
+        if pattern:
+            hits.extend(
+                (positions[match.start()], positions[match.end() - 1] + 1)
+                for match in pattern.finditer(folded_text)
+            )
+
+    return [
+        text[start:end].strip()
+        for start, end in merge_windows(hits, len(text), window)
+    ]
+
+
+def snippet_text(text, search_terms, window=SNIPPET_WINDOW):
+    """Join the snippets around the search term hits into one text.
+    Without a locatable hit (e.g. a fuzzy match) the start of the text is kept."""
+    snippets = extract_snippets(text, search_terms, window)
+    if not snippets:
+        return text[: 2 * window].strip()
+    return SNIPPET_SEPARATOR.join(snippets)
@@ -0,0 +1,92 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Default similarity needed for a fuzzy hit (0-1)
+FUZZY_THRESHOLD = 0.5
+
+
+def fold_text(text):
+    """Lowercase text and strip diacritics, so "Kånken" and "kanken" are equal."""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def compact_text(text):
+    """Fold text and remove everything except letters and digits,
+    so "NF 0A3 XYZ", "nf0a3xyz" and "NF-0A3-XYZ" become the same string."""
+    return re.sub(r"[\W_]+", "", fold_text(text))
+
+
+def trigrams(text):
+    """Return the set of trigrams in a compacted text. Short texts are their own trigram."""
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Trigram index over extracted document text for fuzzy article number and product name lookup.
+
+    Every run of up to max_phrase_tokens adjacent words is compacted and indexed,
+    so article numbers split by spaces or dashes are found as a single entry.
+    Documents are identified by any hashable doc_id, e.g. a row index or a page number.
+    """
+
+    def __init__(self, max_phrase_tokens=3):
+        self.max_phrase_tokens = max_phrase_tokens
+        self.entry_ids = {}  # compacted phrase -> entry id
+        self.entry_trigram_counts = []  # entry id -> number of trigrams
+        self.entry_documents = []  # entry id -> set of doc ids
+        self.postings = defaultdict(set)  # trigram -> entry ids
+
+    def add_document(self, doc_id, text):
+        """Index all phrases in the text under doc_id."""
+        tokens = re.findall(r"\w+", fold_text(text))
+        for start in range(len(tokens)):
+            phrase = ""
+            for token in tokens[start : start + self.max_phrase_tokens]:
+                phrase += token.replace("_", "")
+                if len(phrase) >= 3:
+                    self._add_entry(phrase, doc_id)
+
+    def _add_entry(self, phrase, doc_id):
+        entry_id = self.entry_ids.get(phrase)
+        if entry_id is None:
+            entry_id = len(self.entry_trigram_counts)
+            self.entry_ids[phrase] = entry_id
+            phrase_trigrams = trigrams(phrase)
+            self.entry_trigram_counts.append(len(phrase_trigrams))
+            self.entry_documents.append(set())
+            for trigram in phrase_trigrams:
+                self.postings[trigram].add(entry_id)
+        self.entry_documents[entry_id].add(doc_id)
+
+    def search(self, search_term, threshold=FUZZY_THRESHOLD):
+        """Return [(doc_id, score)] for documents with a phrase similar to the search term,
+        best matches first. The score is the Jaccard similarity of the trigram sets."""
+        term_trigrams = trigrams(compact_text(search_term))
+        if not term_trigrams:
+            return []
+
+        shared_counts = defaultdict(int)
+        for trigram in term_trigrams:
+            for entry_id in self.postings.get(trigram, ()):
+                shared_counts[entry_id] += 1
+
+        document_scores = {}
+        for entry_id, shared in shared_counts.items():
+            score = shared / (
+                len(term_trigrams) + self.entry_trigram_counts[entry_id] - shared
+            )
+            if score < threshold:
+                continue
+            for doc_id in self.entry_documents[entry_id]:
+                if score > document_scores.get(doc_id, 0):
+                    document_scores[doc_id] = score
+
+        return sorted(document_scores.items(), key=lambda item: item[1], reverse=True)
+
+    def matching_documents(self, search_term, threshold=FUZZY_THRESHOLD):
+        """Return the set of doc ids with a fuzzy match for the search term."""
+        return {doc_id for doc_id, _ in self.search(search_term, threshold)}
@@ -7,63 +7,112 @@ from openai import OpenAI
 import cv2
 import numpy as np
 import base64
-import os
-import json
+import hashlib
+import sqlite3
 from datetime import datetime
 from typing import Dict, Tuple, Optional
 
 
+# Model and prompt used for classification. Bump the prompt version when the prompt
+# changes, cached classifications of other models or prompt versions are not reused
+CLASSIFY_MODEL = "gpt-4-vision-preview"
+CLASSIFY_PROMPT = "Classify this image into one of these categories: 'studio-product', 'lifestyle-product', 'mood'. Respond with just the category."
+CLASSIFY_PROMPT_VERSION = 1
+
+
 class ImageAnalyzer:
-    """Handles image classification and processing using OpenAI Vision API."""
+    """Handles image classification and processing using OpenAI Vision API.
+
+    Classifications are cached in SQLite, keyed by the content hash of the image
+    plus model and prompt version, so renamed or copied images are still found.
+    The cache uses WAL mode and can be shared by several processes."""
 
-    def __init__(self, api_key: str, cache_file: str = "image_cache.json"):
-        """Initialize analyzer with OpenAI API key and optional cache file."""
+    def __init__(self, api_key: str, cache_file: str = "image_cache.db"):
+        """Initialize analyzer with OpenAI API key and optional cache database file."""
         self.client = OpenAI(api_key=api_key)
         self.cache_file = cache_file
-        self._load_cache()
+        self._init_cache()
+
+    def _init_cache(self) -> None:
+        """Open the cache database and create the table if needed."""
+        # Wait for other processes writing to the cache instead of failing
+        self.conn = sqlite3.connect(self.cache_file, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS classifications (
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (content_hash, model, prompt_version)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
 
-    def _load_cache(self) -> None:
-        """Load cached results from file."""
+    def _get_cached(self, content_hash: str) -> Optional[str]:
+        """Look up a cached classification, the primary key is the lookup index."""
         try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, "r") as f:
-                    self.cache = json.load(f)
-            else:
-                self.cache = {}
-        except Exception as e:
-            print(f"Cache loading error: {e}")
-            self.cache = {}
-
-    def _save_cache(self) -> None:
-        """Save results to cache file."""
+            row = self.conn.execute(
+                """
+                SELECT category FROM classifications
+                WHERE content_hash = ? AND model = ? AND prompt_version = ?
+                """,
+                (content_hash, CLASSIFY_MODEL, CLASSIFY_PROMPT_VERSION),
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Cache lookup error: {e}")
+            return None
+
+    def _save_cached(self, content_hash: str, category: str) -> None:
+        """Insert a single classification into the cache."""
         try:
-            with open(self.cache_file, "w") as f:
-                json.dump(self.cache, f)
-        except Exception as e:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                    (
+                        content_hash,
+                        CLASSIFY_MODEL,
+                        CLASSIFY_PROMPT_VERSION,
+                        category,
+                        datetime.now().isoformat(),
+                    ),
+                )
+        except sqlite3.Error as e:
             print(f"Cache saving error: {e}")
 
+    def close(self) -> None:
+        self.conn.close()
+
     def classify_image(self, image_path: str) -> Tuple[str, bool]:
         """
         Classify image using OpenAI Vision API.
         Returns: (category, from_cache)
         """
-        # Check cache first
-        if image_path in self.cache:
-            return self.cache[image_path], True
-
         try:
+            # Read the image once, for both the cache key and the request
             with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+                image_data = image_file.read()
+            content_hash = hashlib.blake2b(image_data, digest_size=20).hexdigest()
+
+            # Check cache first
+            category = self._get_cached(content_hash)
+            if category is not None:
+                return category, True
 
+            base64_image = base64.b64encode(image_data).decode("utf-8")
             response = self.client.chat.completions.create(
-                model="gpt-4-vision-preview",
+                model=CLASSIFY_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
                             {
                                 "type": "text",
-                                "text": "Classify this image into one of these categories: 'studio-product', 'lifestyle-product', 'mood'. Respond with just the category.",
+                                "text": CLASSIFY_PROMPT,
                             },
                             {
                                 "type": "image_url",
@@ -77,8 +126,7 @@ class ImageAnalyzer:
                 max_tokens=10,
             )
             category = response.choices[0].message.content.strip()
-            self.cache[image_path] = category
-            self._save_cache()
+            self._save_cached(content_hash, category)
             return category, False
         except Exception as e:
             print(f"Classification error: {e}")
@@ -0,0 +1,66 @@
+import os
+import re
+
+# Output names look like <base>_<suffix>_<counter><ext>, e.g. kanken_ConA_3.jpg
+NUMBERED_FILENAME_PATTERN = re.compile(r"^(.*)_([^_]+)_(\d+)(\.[^.]*)?$")
+
+
+class FilenameAllocator:
+    """Allocates unique output file names of the form <base>_<suffix>_<counter><ext>.
+
+    Each destination folder is listed once and the next free counter per base name
+    is kept in memory, so allocating a name does not probe the folder file by file.
+    Names are claimed with an exclusive create, so several processes writing into
+    the same folder never get the same name; on a collision the next counter is tried.
+
+    Usage:
+        filename_allocator = FilenameAllocator()
+        save_path = filename_allocator.allocate(destination_folder, "kanken.jpg", "ConA")
+    """
+
+    def __init__(self):
+        self.scanned_folders = set()
+        self.counters = {}  # (folder, base, suffix, ext) -> next counter to try
+
+    def reset(self):
+        """Forget all folders, they are listed again on the next allocation."""
+        self.scanned_folders.clear()
+        self.counters.clear()
+
+    def scan_folder(self, folder):
+        """List the folder once and store the next counter for every numbered output name."""
+        self.scanned_folders.add(folder)
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    match = NUMBERED_FILENAME_PATTERN.match(entry.name)
+                    if not match:
+                        continue
+                    base, suffix, counter, ext = match.groups()
+                    key = self.counter_key(folder, base, suffix, ext or "")
+                    self.counters[key] = max(self.counters.get(key, 1), int(counter) + 1)
+        except OSError as e:
+            print(f"Could not read folder {folder}: {e}")
+
+    def counter_key(self, folder, base, suffix, ext):
+        # Case-insensitive, since Windows shares do not tell names apart by case
+        return folder, base.lower(), suffix.lower(), ext.lower()
+
+    def allocate(self, folder, filename, suffix):
+        """Claim a unique path in the folder by creating an empty file and return the path."""
+        if folder not in self.scanned_folders:
+            self.scan_folder(folder)
+
+        base, ext = os.path.splitext(filename)
+        key = self.counter_key(folder, base, suffix, ext)
+        counter = self.counters.get(key, 1)
+        while True:
+            path = os.path.join(folder, f"{base}_{suffix}_{counter}{ext}")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                # Taken by another process or written after the folder was listed
+                counter += 1
+        self.counters[key] = counter + 1
+        return path
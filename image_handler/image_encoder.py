@@ -0,0 +1,100 @@
+from io import BytesIO
+
+# Encoder settings selectable in ImageProcessingWidget.
+# subsampling: 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0 (JPEG only)
+# passthrough: compliant RGB JPEGs are copied (or hardlinked, if enabled) instead of re-encoded
+ENCODER_PROFILES = {
+    "Max quality JPEG (quality 100)": {
+        "format": "JPEG",
+        "quality": 100,
+        "passthrough": True,
+    },
+    "High quality JPEG (progressive, 4:4:4)": {
+        "format": "JPEG",
+        "quality": 92,
+        "progressive": True,
+        "optimize": True,
+        "subsampling": 0,
+        "passthrough": True,
+    },
+    "Web JPEG (progressive, 4:2:0)": {
+        "format": "JPEG",
+        "quality": 85,
+        "progressive": True,
+        "optimize": True,
+        "subsampling": 2,
+    },
+    "WebP": {
+        "format": "WEBP",
+        "quality": 85,
+        "method": 4,
+    },
+}
+DEFAULT_ENCODER_PROFILE = "Max quality JPEG (quality 100)"
+
+# Lowest quality the target file size mode may go down to
+MIN_TARGET_QUALITY = 40
+
+# Upper bound for the number of trial encodes in the target file size mode
+MAX_TARGET_ITERATIONS = 7
+
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def get_encoder_options(profile_name=DEFAULT_ENCODER_PROFILE, target_size_kb=0):
+    """Return the encoder options of a profile, with an optional target file size in KB (0 = off)."""
+    encoder_options = dict(ENCODER_PROFILES[profile_name])
+    encoder_options["target_size_kb"] = target_size_kb
+    return encoder_options
+
+
+def output_extension(encoder_options):
+    return FORMAT_EXTENSIONS[encoder_options["format"]]
+
+
+def encode_with_quality(img, encoder_options, quality, dpi):
+    """Encode the image in memory with the given quality and return the bytes."""
+    save_options = {
+        key: value
+        for key, value in encoder_options.items()
+        if key not in ("format", "quality", "target_size_kb", "passthrough")
+    }
+    if encoder_options["format"] == "JPEG":
+        save_options["dpi"] = dpi
+    buffer = BytesIO()
+    img.save(buffer, encoder_options["format"], quality=quality, **save_options)
+    return buffer.getvalue()
+
+
+def encode_image(img, encoder_options, dpi):
+    """Encode the image with the encoder options.
+
+    With a target file size, the highest quality whose output fits the target is
+    found with a binary search between MIN_TARGET_QUALITY and the profile quality,
+    limited to MAX_TARGET_ITERATIONS trial encodes. If even the lowest quality is
+    too large, the lowest quality is used.
+    Returns (encoded bytes, quality used)."""
+    max_quality = encoder_options["quality"]
+    target_bytes = encoder_options.get("target_size_kb", 0) * 1024
+    data = encode_with_quality(img, encoder_options, max_quality, dpi)
+    if not target_bytes or len(data) <= target_bytes:
+        return data, max_quality
+
+    best = None
+    low, high = MIN_TARGET_QUALITY, max_quality - 1
+    for _ in range(MAX_TARGET_ITERATIONS):
+        if low > high:
+            break
+        quality = (low + high) // 2
+        candidate = encode_with_quality(img, encoder_options, quality, dpi)
+        if len(candidate) <= target_bytes:
+            best = (candidate, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    if best is None:
+        return encode_with_quality(img, encoder_options, MIN_TARGET_QUALITY, dpi), (
+            MIN_TARGET_QUALITY
+        )
+    return best
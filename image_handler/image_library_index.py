@@ -0,0 +1,225 @@
+import os
+import sqlite3
+from collections import defaultdict
+from PIL import Image
+
+# The index of all image libraries is stored locally, image banks are often read-only network shares
+IMAGE_INDEX_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".conalite", "image_library_index.db"
+)
+# Extensions processed by "Process Folder Images". The index itself holds every file,
+# since search terms are matched against all file names like the folder walk did
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tiff", ".tif", ".webp")
+
+# Bump when the indexed content changes, existing indexes are then rescanned once
+INDEX_VERSION = 1
+
+
+def read_image_size(file_path):
+    """Read the pixel dimensions from the image header without decoding the image.
+    Returns (None, None) for files PIL does not recognize by their extension."""
+    if os.path.splitext(file_path)[1].lower() not in Image.registered_extensions():
+        return None, None
+    try:
+        with Image.open(file_path) as img:
+            return img.size
+    except Exception as e:
+        print(f"Could not read image size for {file_path}: {e}")
+        return None, None
+
+
+class ImageLibraryIndex:
+    """Persistent SQLite index of the files below a search root.
+
+    The index stores path, lowercase file name, size, mtime and, for files PIL
+    can open, pixel dimensions.
+    refresh() only lists directories whose mtime changed since the last refresh,
+    unchanged directories are skipped using the subdirectories stored in the index.
+
+    Usage:
+        library_index = ImageLibraryIndex(folder_to_search)
+        library_index.refresh()
+        for file_name_lower, file_path in library_index.files():
+            ...
+    """
+
+    def __init__(self, root, db_path=IMAGE_INDEX_DB_PATH):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.initialize_database()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def initialize_database(self):
+        conn = self.connect()
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS directories (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    parent TEXT,
+                    mtime REAL NOT NULL,
+                    PRIMARY KEY (root, path)
+                );
+                CREATE TABLE IF NOT EXISTS images (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    directory TEXT NOT NULL,
+                    name_lower TEXT NOT NULL,
+                    size INTEGER,
+                    mtime REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    PRIMARY KEY (root, path)
+                );
+                CREATE INDEX IF NOT EXISTS idx_images_directory ON images (root, directory);
+                CREATE INDEX IF NOT EXISTS idx_images_name ON images (root, name_lower);
+                """
+            )
+            if conn.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+                # Older indexes only held some image formats, forget the directory
+                # mtimes so every folder is listed again on the next refresh
+                conn.execute("DELETE FROM directories")
+                conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def refresh(self, full_rescan=False):
+        """Bring the index up to date with the folder tree.
+        Files changed in place without a change to their directory are only
+        picked up with full_rescan. Returns a dictionary with refresh statistics."""
+        stats = {"directories_scanned": 0, "images_updated": 0, "images_removed": 0}
+        conn = self.connect()
+        try:
+            stored_mtimes = {}
+            subdirectories = defaultdict(list)
+            for path, parent, mtime in conn.execute(
+                "SELECT path, parent, mtime FROM directories WHERE root = ?",
+                (self.root,),
+            ):
+                stored_mtimes[path] = mtime
+                subdirectories[parent].append(path)
+
+            seen_directories = set()
+            folders = [(self.root, None)]
+            while folders:
+                folder, parent = folders.pop()
+                try:
+                    mtime = os.stat(folder).st_mtime
+                except OSError as e:
+                    print(f"Could not read folder {folder}: {e}")
+                    continue
+                seen_directories.add(folder)
+
+                if not full_rescan and stored_mtimes.get(folder) == mtime:
+                    folders.extend((child, folder) for child in subdirectories[folder])
+                    continue
+
+                child_folders = self.refresh_directory(conn, folder, stats)
+                conn.execute(
+                    "INSERT OR REPLACE INTO directories (root, path, parent, mtime) VALUES (?, ?, ?, ?)",
+                    (self.root, folder, parent, mtime),
+                )
+                stats["directories_scanned"] += 1
+                folders.extend((child, folder) for child in child_folders)
+
+            # Remove directories that no longer exist, with their images
+            for folder in set(stored_mtimes) - seen_directories:
+                cursor = conn.execute(
+                    "DELETE FROM images WHERE root = ? AND directory = ?",
+                    (self.root, folder),
+                )
+                stats["images_removed"] += cursor.rowcount
+                conn.execute(
+                    "DELETE FROM directories WHERE root = ? AND path = ?",
+                    (self.root, folder),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+        print(f"ImageLibraryIndex.refresh: {self.root} {stats}")
+        return stats
+
+    def refresh_directory(self, conn, folder, stats):
+        """List one directory and update its images in the index. Returns its subdirectories."""
+        child_folders = []
+        current_files = {}
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        child_folders.append(entry.path)
+                    elif entry.is_file():
+                        file_stat = entry.stat()
+                        current_files[entry.path] = (
+                            entry.name.lower(),
+                            file_stat.st_size,
+                            file_stat.st_mtime,
+                        )
+        except OSError as e:
+            print(f"Could not read folder {folder}: {e}")
+            return child_folders
+
+        stored_files = {
+            path: (size, mtime)
+            for path, size, mtime in conn.execute(
+                "SELECT path, size, mtime FROM images WHERE root = ? AND directory = ?",
+                (self.root, folder),
+            )
+        }
+
+        removed_files = set(stored_files) - set(current_files)
+        conn.executemany(
+            "DELETE FROM images WHERE root = ? AND path = ?",
+            [(self.root, path) for path in removed_files],
+        )
+        stats["images_removed"] += len(removed_files)
+
+        for path, (name_lower, size, mtime) in current_files.items():
+            if stored_files.get(path) == (size, mtime):
+                continue
+            width, height = read_image_size(path)
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO images
+                (root, path, directory, name_lower, size, mtime, width, height)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.root, path, folder, name_lower, size, mtime, width, height),
+            )
+            stats["images_updated"] += 1
+        return child_folders
+
+    def files(self):
+        """Return [(lowercase file name, file path)] for every indexed file below the root."""
+        conn = self.connect()
+        try:
+            return conn.execute(
+                "SELECT name_lower, path FROM images WHERE root = ? ORDER BY path",
+                (self.root,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def images(self):
+        """Return a dictionary with path, directory, size, mtime, width and height per indexed file."""
+        conn = self.connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [
+                dict(row)
+                for row in conn.execute(
+                    """
+                    SELECT path, directory, size, mtime, width, height
+                    FROM images WHERE root = ? ORDER BY path
+                    """,
+                    (self.root,),
+                )
+            ]
+        finally:
+            conn.close()
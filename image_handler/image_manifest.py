@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = ".conA_manifest.json"
+
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Return the BLAKE2b hash of the file content."""
+    content_hash = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+class ImageManifest:
+    """Manifest of the images written to a destination folder.
+
+    Maps each source path to its size, mtime, output file and the output settings used, so re-running a job can skip sources that have not changed since
+    their output was written with the same settings. Sources skipped as duplicates
+    refer to the source they duplicate instead of an output file.
+    The manifest is stored as a hidden JSON file in the destination folder."""
+
+    def __init__(self, destination_folder):
+        self.destination_folder = destination_folder
+        self.manifest_path = os.path.join(destination_folder, MANIFEST_FILENAME)
+        self.changed = False
+        self.images = {}
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, "r") as f:
+                    self.images = json.load(f).get("images", {})
+        except Exception as e:
+            print(f"Manifest loading error: {e}")
+
+    def is_unchanged(self, file_path, settings=None):
+        """Check if the source was processed before with the same settings
+        and neither it nor its output changed since."""
+        entry = self.images.get(os.path.abspath(file_path))
+        if not entry or entry.get("settings") != settings:
+            return False
+        if "duplicate_of" in entry:
+            # A skipped duplicate is unchanged as long as the image it duplicates is
+            if not self.is_unchanged(entry["duplicate_of"], settings):
+                return False
+        elif not os.path.exists(
+            os.path.join(self.destination_folder, entry["output"])
+        ):
+            return False
+
+        try:
+            file_stat = os.stat(file_path)
+            if (file_stat.st_size, file_stat.st_mtime) == (entry["size"], entry["mtime"]):
+                return True
+            # The mtime changed (e.g. copied or touched), compare the content if a hash
+            # was recorded. Sources are not hashed at write time, that would read every
+            # file from the image bank a second time
+            if (
+                entry.get("hash")
+                and file_stat.st_size == entry["size"]
+                and file_content_hash(file_path) == entry["hash"]
+            ):
+                entry["mtime"] = file_stat.st_mtime
+                self.changed = True
+                return True
+        except OSError as e:
+            print(f"Manifest check error for {file_path}: {e}")
+        return False
+
+    def record(self, file_path, output_path, settings=None, content_hash=None):
+        """Record the output written for a source file with the given settings.
+        Only size and mtime are stored unless the content hash is already known."""
+        try:
+            file_stat = os.stat(file_path)
+            self.images[os.path.abspath(file_path)] = {
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+                "hash": content_hash,
+                "output": os.path.relpath(output_path, self.destination_folder),
+                "settings": settings,
+            }
+            self.changed = True
+        except OSError as e:
+            print(f"Manifest record error for {file_path}: {e}")
+
+    def record_duplicate(self, file_path, kept_file_path, settings=None):
+        """Record a source that was skipped as a duplicate of an image processed into this folder."""
+        try:
+            file_stat = os.stat(file_path)
+            self.images[os.path.abspath(file_path)] = {
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+                "hash": None,
+                "duplicate_of": os.path.abspath(kept_file_path),
+                "settings": settings,
+            }
+            self.changed = True
+        except OSError as e:
+            print(f"Manifest record error for {file_path}: {e}")
+
+    def save(self):
+        """Write the manifest if it changed, replacing the old file atomically."""
+        if not self.changed:
+            return
+        try:
+            temporary_path = self.manifest_path + ".tmp"
+            with open(temporary_path, "w") as f:
+                json.dump({"version": 1, "images": self.images}, f)
+            os.replace(temporary_path, self.manifest_path)
+            self.changed = False
+        except Exception as e:
+            print(f"Manifest saving error: {e}")
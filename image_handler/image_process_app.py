@@ -10,6 +10,9 @@ from PyQt5.QtWidgets import (
     QApplication,
     QScrollArea,
     QSizePolicy,
+    QComboBox,
+    QSpinBox,
+    QCheckBox,
 )
 from PyQt5.QtCore import Qt  # Add this import
 import os
@@ -17,6 +20,13 @@ from widgets.base_widget import BaseProcessingWidget
 from image_handler.image_processing_handler import (
     ImageProcessingHandler,
 )  # Import the new handler class
+from image_handler.image_library_index import ImageLibraryIndex, IMAGE_EXTENSIONS
+from image_handler.thumbnail_gallery import ThumbnailGallery
+from image_handler.image_encoder import (
+    ENCODER_PROFILES,
+    DEFAULT_ENCODER_PROFILE,
+    get_encoder_options,
+)
 
 
 class ImageProcessingWidget(BaseProcessingWidget):
@@ -45,6 +55,7 @@ class ImageProcessingWidget(BaseProcessingWidget):
         - Transparency handling
         - Image resizing
         - Unique filename generation
+        - Selectable output encoder (JPEG profiles, WebP, target file size)
         - Error handling and logging
 
     The widget includes:
@@ -52,6 +63,7 @@ class ImageProcessingWidget(BaseProcessingWidget):
         - Processing start button
         - Folder processing button
         - Status listbox for progress and error messages
+        - Preview gallery with thumbnails of the saved images
         - File dialogs for folder selection
         - Message boxes for warnings and errors
 
@@ -99,6 +111,8 @@ class ImageProcessingWidget(BaseProcessingWidget):
         - Handles ICC profiles.
         - Manages transparency.
         - Generates unique filenames.
+        - Output as JPEG or WebP with a selectable quality profile.
+        - Optional target file size, the quality is lowered until each image fits.
         - Provides error handling and logging.
 
         How to Use:
@@ -107,7 +121,10 @@ class ImageProcessingWidget(BaseProcessingWidget):
         3. Use semicolons to separate different groups of search terms.
         4. Click the 'Process' button to start processing the images.
         5. The tool will process the images and display the results in the listboxes.
+           Saved images are shown in the preview gallery, double-click to open one.
         6. Click 'Show images not found' to see a list of images that were not found.
+        7. Click 'Rescan Image Library' if images were replaced without adding or
+           removing files, the index only rereads changed folders otherwise.
 
         Enjoy using the Image Processing Tool!
         """
@@ -130,6 +147,10 @@ class ImageProcessingWidget(BaseProcessingWidget):
         self.create_search_section()
         self.layout.addSpacing(15)
 
+        # Create output encoder section
+        self.create_encoder_section()
+        self.layout.addSpacing(15)
+
         # Create action buttons
         self.create_buttons()
         self.layout.addSpacing(15)
@@ -150,16 +171,60 @@ class ImageProcessingWidget(BaseProcessingWidget):
         self.entry.setPlaceholderText("Enter search terms...")
         self.layout.addWidget(self.entry)
 
+        self.deduplicate_checkbox = QCheckBox(
+            "Skip near-identical duplicate images within a group (same motif and colours)",
+            self,
+        )
+        self.layout.addWidget(self.deduplicate_checkbox)
+
+    def create_encoder_section(self):
+        label = QLabel("Output Format:")
+        label.setObjectName("section-label")
+        self.layout.addWidget(label)
+
+        self.encoder_profile_combobox = QComboBox(self)
+        self.encoder_profile_combobox.addItems(ENCODER_PROFILES)
+        self.encoder_profile_combobox.setCurrentText(DEFAULT_ENCODER_PROFILE)
+        self.layout.addWidget(self.encoder_profile_combobox)
+
+        self.target_size_spinbox = QSpinBox(self)
+        self.target_size_spinbox.setRange(0, 50000)
+        self.target_size_spinbox.setSingleStep(100)
+        self.target_size_spinbox.setPrefix("Target file size: ")
+        self.target_size_spinbox.setSuffix(" KB")
+        self.target_size_spinbox.setSpecialValueText("Target file size: off")
+        self.layout.addWidget(self.target_size_spinbox)
+
+        self.hardlink_checkbox = QCheckBox(
+            "Hardlink images that need no processing instead of copying them "
+            "(faster, but editing an output file also changes the original in the image bank)",
+            self,
+        )
+        self.layout.addWidget(self.hardlink_checkbox)
+
+    def get_encoder_options(self):
+        """Collect the output encoder options from the widget."""
+        return get_encoder_options(
+            self.encoder_profile_combobox.currentText(),
+            self.target_size_spinbox.value(),
+        )
+
     def create_buttons(self):
-        start_button = QPushButton("Start Search and Processing", self)
-        start_button.clicked.connect(self.start_processing)
-        self.layout.addWidget(start_button)
+        self.start_button = QPushButton("Start Search and Processing", self)
+        self.start_button.clicked.connect(self.start_processing)
+        self.layout.addWidget(self.start_button)
 
-        folder_button = QPushButton(
+        self.folder_button = QPushButton(
             "Process Folder Images\nClick to select folder", self
         )
-        folder_button.clicked.connect(self.process_folder_images)
-        self.layout.addWidget(folder_button)
+        self.folder_button.clicked.connect(self.process_folder_images)
+        self.layout.addWidget(self.folder_button)
+
+        self.rescan_button = QPushButton(
+            "Rescan Image Library\nFinds images replaced in place", self
+        )
+        self.rescan_button.clicked.connect(self.rescan_library)
+        self.layout.addWidget(self.rescan_button)
 
         show_not_found_button = QPushButton("Show images not found", self)
         show_not_found_button.clicked.connect(self.show_not_found_popup)
@@ -186,6 +251,21 @@ class ImageProcessingWidget(BaseProcessingWidget):
         self.not_found_listbox.setMinimumHeight(100)
         self.layout.addWidget(self.not_found_listbox)
 
+        self.layout.addSpacing(10)
+
+        gallery_label = QLabel("Preview of saved images:")
+        gallery_label.setObjectName("section-label")
+        self.layout.addWidget(gallery_label)
+
+        self.gallery = ThumbnailGallery(self)
+        self.gallery.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.gallery.setMinimumHeight(200)
+        self.layout.addWidget(self.gallery)
+
+    def add_to_gallery(self, file_path):
+        """Show a saved image in the preview gallery."""
+        self.gallery.add_image(file_path)
+
     def add_to_listbox(self, message):
         """Add a message to the appropriate listbox view."""
         message = self.shorten_path_in_message(message)
@@ -202,6 +282,7 @@ class ImageProcessingWidget(BaseProcessingWidget):
         self.file_listbox.clear()
         self.not_found_listbox.clear()
         self.not_found_list = []  # Reset the not found list
+        self.gallery.clear()
 
     def show_message_box(self, title, message, icon=QMessageBox.Information):
         """Show a message box, usually critical, with the specified title, message, and icon."""
@@ -227,8 +308,23 @@ class ImageProcessingWidget(BaseProcessingWidget):
             not_found_str = "\n".join(self.not_found_list)
             self.show_message_box("Images Not Found", not_found_str)
 
+    def set_processing_buttons_enabled(self, enabled):
+        """Enable or disable the buttons that start a run. The GUI keeps handling events
+        while images are processed, so a second click must not start a nested run."""
+        self.start_button.setEnabled(enabled)
+        self.folder_button.setEnabled(enabled)
+        self.rescan_button.setEnabled(enabled)
+
     def start_processing(self):
         """Start the image processing based on the search terms entered by the user."""
+        self.set_processing_buttons_enabled(False)
+        try:
+            self.run_search_processing()
+        finally:
+            self.set_processing_buttons_enabled(True)
+
+    def run_search_processing(self):
+        """Search the image library for the search term groups and process the matches."""
         self.clear_listbox()
         search_terms = self.entry.text()
         if not self.validate_search_terms(search_terms):
@@ -245,11 +341,13 @@ class ImageProcessingWidget(BaseProcessingWidget):
             self.show_message_box("Warning", "No folder selected.", QMessageBox.Warning)
             return
 
+        # Match every group against the persistent index of the image library
+        filename_index = self.load_library_index(folder_to_search).files()
+
+        search_terms_lists = []
+        group_destination_folders = []
         for group in search_groups:
             search_terms_list = [term.strip() for term in group.split(",")]
-            print(
-                f"Processing group: {search_terms_list}"
-            )  # Debugging to check which group is being processed
             group_folder_name = search_terms_list[
                 0
             ]  # Use the first search term as the group folder name
@@ -260,13 +358,29 @@ class ImageProcessingWidget(BaseProcessingWidget):
             if not os.path.exists(group_destination_folder):
                 os.makedirs(group_destination_folder)
 
-            # Process images using the search terms and folders
-            self.image_handler.process_images_by_search_terms(
-                search_terms_list, folder_to_search, group_destination_folder
-            )
+            search_terms_lists.append(search_terms_list)
+            group_destination_folders.append(group_destination_folder)
+
+        # Process images for all groups with one scan of the file names
+        self.image_handler.encoder_options = self.get_encoder_options()
+        self.image_handler.use_hardlinks = self.hardlink_checkbox.isChecked()
+        self.image_handler.process_search_groups(
+            search_terms_lists,
+            group_destination_folders,
+            filename_index,
+            deduplicate=self.deduplicate_checkbox.isChecked(),
+        )
 
     def process_folder_images(self):
         """Process all images in a selected folder and subfolders."""
+        self.set_processing_buttons_enabled(False)
+        try:
+            self.run_folder_processing()
+        finally:
+            self.set_processing_buttons_enabled(True)
+
+    def run_folder_processing(self):
+        """Ask for a folder and a destination and process every image in the folder."""
         self.clear_listbox()
         folder_path = QFileDialog.getExistingDirectory(self, "Välj mapp med bilder")
         if not folder_path:
@@ -282,23 +396,22 @@ class ImageProcessingWidget(BaseProcessingWidget):
         self.file_listbox.addItem(f"Processing folder: {folder_path}")
 
         try:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    if file.lower().endswith(
-                        (".jpg", ".jpeg", ".png", ".tiff", ".tif", ".webp")
-                    ):
-                        image_path = os.path.join(root, file)
-                        relative_path = os.path.relpath(root, folder_path)
-                        destination_dir = os.path.join(
-                            destination_folder, relative_path
-                        )
-                        os.makedirs(destination_dir, exist_ok=True)
-
-                        self.file_listbox.addItem(f"Processing image: {image_path}")
-                        self.image_handler.process_and_save_image(
-                            image_path, destination_dir
-                        )
-                        self.file_listbox.addItem("Processing complete")
+            library_index = self.load_library_index(folder_path)
+            jobs = []
+            for file_name_lower, image_path in library_index.files():
+                if not file_name_lower.endswith(IMAGE_EXTENSIONS):
+                    continue
+                relative_path = os.path.relpath(
+                    os.path.dirname(image_path), library_index.root
+                )
+                destination_dir = os.path.join(destination_folder, relative_path)
+                os.makedirs(destination_dir, exist_ok=True)
+                jobs.append((image_path, destination_dir))
+
+            self.file_listbox.addItem(f"Processing {len(jobs)} images")
+            self.image_handler.encoder_options = self.get_encoder_options()
+            self.image_handler.use_hardlinks = self.hardlink_checkbox.isChecked()
+            self.image_handler.process_images_parallel(jobs)
             self.add_to_listbox("All images processed")
         except Exception as e:
             self.add_to_listbox(
@@ -308,6 +421,40 @@ class ImageProcessingWidget(BaseProcessingWidget):
                 "Error", f"Error processing folder: {str(e)}", QMessageBox.Critical
             )  # Show error message box
 
+    def rescan_library(self):
+        """Rescan every folder of an image library. A normal refresh only lists folders
+        whose mtime changed, files overwritten in place are only found by a rescan."""
+        self.set_processing_buttons_enabled(False)
+        try:
+            self.clear_listbox()
+            folder = QFileDialog.getExistingDirectory(self, "Välj bildbibliotek")
+            if not folder:
+                self.show_message_box(
+                    "Warning", "No folder selected.", QMessageBox.Warning
+                )
+                return
+            self.load_library_index(folder, full_rescan=True)
+        except Exception as e:
+            self.add_to_listbox(f"Error rescanning library: {str(e)}")
+            self.show_message_box(
+                "Error", f"Error rescanning library: {str(e)}", QMessageBox.Critical
+            )
+        finally:
+            self.set_processing_buttons_enabled(True)
+
+    def load_library_index(self, folder, full_rescan=False):
+        """Open the persistent image index for the folder and refresh changed directories.
+        With full_rescan every folder is listed and every file compared."""
+        self.file_listbox.addItem(f"Updating image index for: {folder}")
+        QApplication.processEvents()
+        library_index = ImageLibraryIndex(folder)
+        stats = library_index.refresh(full_rescan=full_rescan)
+        self.file_listbox.addItem(
+            f"Image index updated: {stats['directories_scanned']} folders scanned, "
+            f"{stats['images_updated']} images added or changed, {stats['images_removed']} removed"
+        )
+        return library_index
+
     def validate_search_terms(self, search_terms):
         """Validate the search terms entered by the user."""
         if not search_terms:
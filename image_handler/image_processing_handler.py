@@ -1,91 +1,443 @@
 from PIL import Image, ImageCms
 from io import BytesIO
-from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QMessageBox, QApplication
 import os
+import math
+import hashlib
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from shutil import copy2
+from image_handler.term_matcher import TermMatcher
+from image_handler.image_manifest import ImageManifest
+from image_handler.filename_allocator import (
+    FilenameAllocator,
+    NUMBERED_FILENAME_PATTERN,
+)
+from image_handler.perceptual_hash import compute_image_fingerprint, find_duplicates
+from image_handler.image_encoder import (
+    get_encoder_options,
+    encode_image,
+    output_extension,
+)
+
+
+def build_filename_index(folder):
+    """Walk the folder tree once with os.scandir and return a list of
+    (lowercase file name, file path) for every file in the folder and its subfolders."""
+    filename_index = []
+    folders = [folder]
+    while folders:
+        current_folder = folders.pop()
+        try:
+            with os.scandir(current_folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file():
+                        filename_index.append((entry.name.lower(), entry.path))
+        except OSError as e:
+            print(f"Could not read folder {current_folder}: {e}")
+    return filename_index
+
+
+# Number of worker processes used to process images in parallel
+IMAGE_PROCESS_WORKERS = os.cpu_count() or 1
+
+# Longest side of resized images in pixels
+MAX_IMAGE_DIMENSION = 2500
+
+
+# Number of CMYK to sRGB colour transforms kept per process, keyed by ICC profile
+ICC_TRANSFORM_CACHE_SIZE = 32
+
+# One allocator per process, worker processes claim their names with an exclusive create
+filename_allocator = FilenameAllocator()
+
+_icc_transform_cache = OrderedDict()
+_srgb_profile = None
+
+
+def get_cmyk_to_srgb_transform(icc_profile):
+    """Return a prebuilt CMYK to sRGB transform for the ICC profile bytes.
+    Supplier batches often share one profile, so transforms are cached per process by a hash
+    of the profile bytes and the least recently used transform is evicted.
+    Returns None if the profile could not be used."""
+    global _srgb_profile
+    profile_hash = hashlib.blake2b(icc_profile, digest_size=16).digest()
+    if profile_hash in _icc_transform_cache:
+        _icc_transform_cache.move_to_end(profile_hash)
+        return _icc_transform_cache[profile_hash]
+
+    try:
+        if _srgb_profile is None:
+            _srgb_profile = ImageCms.createProfile("sRGB")
+        cmyk_profile = ImageCms.getOpenProfile(BytesIO(icc_profile))
+        transform = ImageCms.buildTransform(cmyk_profile, _srgb_profile, "CMYK", "RGB")
+    except Exception as e:
+        # Remember broken profiles too, so they are not parsed again for every image
+        print(f"Could not build ICC transform: {e}")
+        transform = None
+
+    _icc_transform_cache[profile_hash] = transform
+    if len(_icc_transform_cache) > ICC_TRANSFORM_CACHE_SIZE:
+        _icc_transform_cache.popitem(last=False)
+    return transform
+
+
+class StatusCollector:
+    """Stands in for the widget in worker processes and collects the status messages."""
+
+    def __init__(self):
+        self.messages = []
+
+    def add_to_listbox(self, message):
+        self.messages.append(message)
+
+    def show_message_box(self, title, message, icon=None):
+        self.messages.append(f"{title}: {message}")
+
+    def add_to_gallery(self, file_path):
+        pass  # Saved images are added to the gallery by the main process
+
+
+def process_image_file(file_path, destination_folder, encoder_options, use_hardlinks):
+    """Process and save one image in a worker process.
+    Returns (status messages, saved file path)."""
+    status_collector = StatusCollector()
+    save_path = ImageProcessingHandler(
+        status_collector, encoder_options, use_hardlinks
+    ).process_and_save_image(file_path, destination_folder)
+    return status_collector.messages, save_path
 
 
 class ImageProcessingHandler:
-    def __init__(self, widget):
+    def __init__(self, widget, encoder_options=None, use_hardlinks=False):
         self.widget = widget
+        # Output format and quality, see image_encoder.ENCODER_PROFILES
+        self.encoder_options = encoder_options or get_encoder_options()
+        # Hardlink passthrough images instead of copying them. A hardlinked output is
+        # the same file as the original, editing it in place also changes the original
+        self.use_hardlinks = use_hardlinks
 
     def process_images_by_search_terms(
-        self, search_terms_list, folder_to_search, group_destination_folder
+        self,
+        search_terms_list,
+        folder_to_search,
+        group_destination_folder,
+        filename_index=None,
+    ):
+        """Process images based on a list of search terms in a group, searching through all subfolders.
+        Pass a filename_index from ImageLibraryIndex.files() or build_filename_index
+        to reuse one folder walk for several groups."""
+        # Walk through the entire directory tree once, searching through all subfolders
+        if filename_index is None:
+            filename_index = build_filename_index(folder_to_search)
+
+        self.process_search_groups(
+            [search_terms_list], [group_destination_folder], filename_index
+        )
+
+    def process_search_groups(
+        self,
+        search_groups,
+        group_destination_folders,
+        filename_index,
+        deduplicate=False,
     ):
-        """Process images based on a list of search terms in a group, searching through all subfolders."""
-        search_terms_not_found = []
-        search_terms = [
-            term.strip() for term in search_terms_list
-        ]  # Clean the search terms
-        any_term_found = False
-
-        for search_term in search_terms:
-            term_found = False
-
-            # Walk through the entire directory tree, searching through all subfolders
-            for root, _, files in os.walk(folder_to_search):
-                for file in files:
-                    # Check if the search term is in the file name (case-insensitive)
-                    if search_term.lower() in file.lower():
-                        file_path = os.path.join(root, file)
-
-                        # Process the matching image
-                        self.process_and_save_image(file_path, group_destination_folder)
-                        term_found = (
-                            True  # At least one file was found for this search term
+        """Process images for several groups of search terms with a single scan of the file names.
+        All search terms of all groups are compiled into one TermMatcher, so each
+        file name is scanned once regardless of the number of search terms.
+        With deduplicate, near-identical images (same motif and colours) within a group
+        are processed once.
+        The matching images of all groups are processed in parallel, a file matching
+        several search terms or groups is processed once and linked into each group folder."""
+        matcher = TermMatcher(search_groups)
+
+        # Group index -> search term -> matching file paths
+        group_matches = [defaultdict(list) for _ in search_groups]
+        for file_name_lower, file_path in filename_index:
+            for group_index, search_term in matcher.match(file_name_lower):
+                group_matches[group_index][search_term].append(file_path)
+
+        group_files = []
+        groups_found = []
+        for search_terms_list, group_destination_folder, matches in zip(
+            search_groups, group_destination_folders, group_matches
+        ):
+            print(
+                f"Processing group: {search_terms_list}"
+            )  # Debugging to check which group is being processed
+            search_terms_not_found = []
+            search_terms = [
+                term.strip() for term in search_terms_list
+            ]  # Clean the search terms
+
+            file_paths_in_group = []
+            for search_term in search_terms:
+                # Queue the matching images of the search term for processing
+                file_paths = matches.get(search_term, [])
+                file_paths_in_group.extend(file_paths)
+
+                # If no files were found for the search term, add it to the list of not found terms
+                if not file_paths:
+                    search_terms_not_found.append(search_term)
+                    self.widget.add_to_listbox(
+                        f"Not found: {search_term}"
+                    )  # Add the search term to the listbox
+                    print(
+                        f"Search term not found: {search_term}"
+                    )  # Print statement for not found search terms
+
+            groups_found.append(len(search_terms_not_found) < len(search_terms))
+            group_files.append(file_paths_in_group)
+
+        duplicates = []
+        if deduplicate:
+            group_files, duplicates = self.remove_duplicate_images(
+                group_files, group_destination_folders
+            )
+
+        jobs = [
+            (file_path, group_destination_folder)
+            for file_paths, group_destination_folder in zip(
+                group_files, group_destination_folders
+            )
+            for file_path in file_paths
+        ]
+        self.process_images_parallel(jobs, duplicates)
+
+        for search_terms_list, group_destination_folder, any_term_found in zip(
+            search_groups, group_destination_folders, groups_found
+        ):
+            # Delete the group folder if no search terms were found
+            if not any_term_found:
+                self.delete_empty_group_folder(group_destination_folder)
+
+            # Show a message once processing is complete
+            self.widget.add_to_listbox(
+                f"Processing Complete for {search_terms_list}"
+            )  # Add a message to the listbox for the group
+            print(
+                f"Processing complete for group: {search_terms_list}"
+            )  # Print statement for processing completion
+
+    def remove_duplicate_images(self, group_files, group_destination_folders):
+        """Drop near-identical images within each group using a perceptual hash (dHash)
+        and a coarse colour grid, so colourways of one product are not dropped.
+        Files the manifest of the group folder marks as unchanged are not hashed again,
+        they are left for process_images_parallel to skip. The largest image of a set of
+        duplicates is kept. Returns (file paths to process per group,
+        [(duplicate file path, kept file path, group folder)])."""
+        group_candidates = []
+        for file_paths_in_group, group_destination_folder in zip(
+            group_files, group_destination_folders
+        ):
+            manifest = ImageManifest(group_destination_folder)
+            group_candidates.append(
+                [
+                    file_path
+                    for file_path in dict.fromkeys(file_paths_in_group)
+                    if not manifest.is_unchanged(file_path, self.encoder_options)
+                ]
+            )
+
+        file_paths = list(
+            dict.fromkeys(path for paths in group_candidates for path in paths)
+        )
+        if len(file_paths) < 2:
+            return group_files, []
+
+        if IMAGE_PROCESS_WORKERS < 2:
+            fingerprints = dict(
+                zip(file_paths, map(compute_image_fingerprint, file_paths))
+            )
+        else:
+            with ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS) as executor:
+                fingerprints = dict(
+                    zip(
+                        file_paths,
+                        executor.map(
+                            compute_image_fingerprint, file_paths, chunksize=16
+                        ),
+                    )
+                )
+
+        unique_group_files = []
+        all_duplicates = []
+        for file_paths_in_group, candidates, group_destination_folder in zip(
+            group_files, group_candidates, group_destination_folders
+        ):
+            _, duplicates = find_duplicates(
+                [(file_path,) + fingerprints[file_path] for file_path in candidates]
+            )
+            duplicate_paths = set()
+            for duplicate_path, kept_path in duplicates:
+                self.widget.add_to_listbox(
+                    f"Duplicate skipped: {duplicate_path} (same image as {kept_path})"
+                )
+                duplicate_paths.add(duplicate_path)
+                all_duplicates.append(
+                    (duplicate_path, kept_path, group_destination_folder)
+                )
+            unique_group_files.append(
+                [path for path in file_paths_in_group if path not in duplicate_paths]
+            )
+        return unique_group_files, all_duplicates
+
+    def process_images_parallel(self, jobs, duplicates=()):
+        """Process and save (file_path, destination_folder) jobs in a process pool sized
+        to the machine. Status messages are passed to the widget as each image finishes.
+        A file matched for several destination folders is decoded and processed once,
+        the result is hardlinked or copied into the other folders.
+        Sources recorded as unchanged in the manifest of their destination folder are skipped.
+        duplicates from remove_duplicate_images are recorded in the manifests, so they
+        are skipped on the next run as long as the image they duplicate is unchanged."""
+        # Files may have been added or removed since the last run, list the folders again
+        filename_allocator.reset()
+        manifests = {}
+        # File path -> destination folders still to write, in the order of the jobs
+        pending_files = defaultdict(list)
+        for file_path, destination_folder in jobs:
+            if destination_folder not in manifests:
+                manifests[destination_folder] = ImageManifest(destination_folder)
+            if destination_folder in pending_files.get(file_path, []):
+                continue  # Matched by several search terms of the same group
+            if manifests[destination_folder].is_unchanged(
+                file_path, self.encoder_options
+            ):
+                self.widget.add_to_listbox(f"Unchanged, skipped: {file_path}")
+            else:
+                pending_files[file_path].append(destination_folder)
+
+        try:
+            if len(pending_files) < 2 or IMAGE_PROCESS_WORKERS < 2:
+                for file_path, destination_folders in pending_files.items():
+                    save_path = self.process_and_save_image(
+                        file_path, destination_folders[0]
+                    )
+                    if save_path:
+                        self.record_and_distribute(
+                            file_path, save_path, destination_folders, manifests
+                        )
+                return
+
+            with ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS) as executor:
+                futures = {
+                    executor.submit(
+                        process_image_file,
+                        file_path,
+                        destination_folders[0],
+                        self.encoder_options,
+                        self.use_hardlinks,
+                    ): file_path
+                    for file_path, destination_folders in pending_files.items()
+                }
+                for future in as_completed(futures):
+                    file_path = futures[future]
+                    try:
+                        messages, save_path = future.result()
+                    except Exception as e:
+                        messages, save_path = (
+                            [f"Error processing image {file_path}: {str(e)}"],
+                            None,
                         )
-                        any_term_found = True
+                    for message in messages:
+                        self.widget.add_to_listbox(message)
+                    if save_path:
+                        self.record_and_distribute(
+                            file_path, save_path, pending_files[file_path], manifests
+                        )
+                    # Keep the GUI responsive while the workers are running
+                    QApplication.processEvents()
+        finally:
+            for duplicate_path, kept_path, destination_folder in duplicates:
+                manifest = manifests.get(destination_folder)
+                if manifest and os.path.abspath(kept_path) in manifest.images:
+                    manifest.record_duplicate(
+                        duplicate_path, kept_path, self.encoder_options
+                    )
+            for manifest in manifests.values():
+                manifest.save()
 
-            # If no files were found for the search term, add it to the list of not found terms
-            if not term_found:
-                search_terms_not_found.append(search_term)
+    def record_and_distribute(
+        self, file_path, save_path, destination_folders, manifests
+    ):
+        """Record the output saved in the first destination folder and hardlink or copy it
+        into the other destination folders under the same name pattern."""
+        manifests[destination_folders[0]].record(
+            file_path, save_path, self.encoder_options
+        )
+        self.widget.add_to_gallery(save_path)
+        match = NUMBERED_FILENAME_PATTERN.match(os.path.basename(save_path))
+        for destination_folder in destination_folders[1:]:
+            try:
+                if match:
+                    base, suffix, _, ext = match.groups()
+                    other_save_path = self.generate_unique_filename(
+                        destination_folder, base + (ext or ""), suffix
+                    )
+                else:
+                    other_save_path = os.path.join(
+                        destination_folder, os.path.basename(save_path)
+                    )
+                self.link_or_copy(save_path, other_save_path)
+                manifests[destination_folder].record(
+                    file_path, other_save_path, self.encoder_options
+                )
+                self.widget.add_to_listbox(
+                    f"Bild redan processad, kopierad: {other_save_path}"
+                )
+                self.widget.add_to_gallery(other_save_path)
+            except OSError as e:
                 self.widget.add_to_listbox(
-                    f"Not found: {search_term}"
-                )  # Add the search term to the listbox
-                print(
-                    f"Search term not found: {search_term}"
-                )  # Print statement for not found search terms
-
-        # Delete the group folder if no search terms were found
-        if not any_term_found:
-            self.delete_empty_group_folder(group_destination_folder)
-
-        # Show a message once processing is complete
-        self.widget.add_to_listbox(
-            f"Processing Complete for {search_terms_list}"
-        )  # Add a message to the listbox for the group
-        print(
-            f"Processing complete for group: {search_terms_list}"
-        )  # Print statement for processing completion
+                    f"Error copying {save_path} to {destination_folder}: {str(e)}"
+                )
 
     def process_and_save_image(self, file_path, destination_folder):
-        """Main image processing and saving function"""
+        """Main image processing and saving function. Returns the saved file path or None on errors."""
+        save_path = None
         try:
             with Image.open(file_path) as img:
                 # Store the original DPI before any processing
                 original_dpi = img.info.get("dpi", (72, 72))
+
+                # Only the header has been read so far, compliant files are not decoded at all
+                if self.is_passthrough_compliant(img, file_path, original_dpi):
+                    filename = os.path.splitext(os.path.basename(file_path))[0] + ".jpg"
+                    save_path = self.generate_unique_filename(
+                        destination_folder, filename, "ConA"
+                    )
+                    self.link_or_copy(file_path, save_path)
+                    self.widget.add_to_listbox(
+                        f"Bild redan korrekt, kopierad: {save_path}"
+                    )
+                    return save_path
+
+                self.draft_oversized_image(img, original_dpi)
                 status, processed_img = self.process_image(img, file_path)
 
                 # Make sure the processed image retains the original DPI
                 processed_img.info["dpi"] = original_dpi
 
                 if status == "lowres":
-                    lowres_filename = (
-                        os.path.splitext(os.path.basename(file_path))[0] + ".jpg"
-                    )
+                    lowres_filename = os.path.splitext(os.path.basename(file_path))[
+                        0
+                    ] + output_extension(self.encoder_options)
                     save_path = self.generate_unique_filename(
                         destination_folder, lowres_filename, "LOWRES"
                     )
-                    processed_img.save(save_path, "JPEG", quality=100, dpi=original_dpi)
+                    self.save_encoded_image(processed_img, save_path, original_dpi)
                     self.widget.add_to_listbox(f"Bild är för liten: {save_path}")
-                    return
+                    return save_path
 
                 elif status == "success":
-                    filename = os.path.splitext(os.path.basename(file_path))[0] + ".jpg"
+                    filename = os.path.splitext(os.path.basename(file_path))[
+                        0
+                    ] + output_extension(self.encoder_options)
                     save_path = self.generate_unique_filename(
                         destination_folder, filename, "ConA"
                     )
-                    processed_img.save(save_path, "JPEG", quality=100, dpi=original_dpi)
+                    self.save_encoded_image(processed_img, save_path, original_dpi)
                     self.widget.add_to_listbox(f"Bild processad: {save_path}")
                     print(f"File saved: {save_path} with original DPI: {original_dpi}")
 
@@ -102,10 +454,60 @@ class ImageProcessingHandler:
                     self.widget.add_to_listbox(
                         f"Image found but not processed, copied to: {save_path}"
                     )
+                return save_path
 
         except Exception as e:
             self.widget.add_to_listbox(f"Error processing image: {str(e)}")
             print(f"Error processing image: {str(e)}")
+            # Remove the claimed output name if nothing was written to it
+            if save_path and os.path.exists(save_path) and not os.path.getsize(save_path):
+                os.remove(save_path)
+            return None
+
+    def is_passthrough_compliant(self, img, file_path, original_dpi):
+        """Check from the image header if the file can be used as it is: an RGB JPEG
+        without transparency, within the size limits and, with a target file size, small enough."""
+        target_size_kb = self.encoder_options.get("target_size_kb", 0)
+        return (
+            self.encoder_options.get("passthrough", False)
+            and self.encoder_options["format"] == "JPEG"
+            and img.format == "JPEG"
+            and img.mode == "RGB"
+            and "transparency" not in img.info
+            and not self.needs_resize(img.width, img.height, original_dpi)
+            and img.width >= 800
+            and img.height >= 600
+            and (
+                not target_size_kb
+                or os.path.getsize(file_path) <= target_size_kb * 1024
+            )
+        )
+
+    def link_or_copy(self, file_path, save_path):
+        """Copy the file to the claimed output path. With use_hardlinks the file is
+        hardlinked instead, falling back to a copy if linking is not possible
+        (other drive, network share or a file system without hardlinks)."""
+        if not self.use_hardlinks:
+            copy2(file_path, save_path)
+            return
+        temporary_path = save_path + ".tmp"
+        try:
+            os.link(file_path, temporary_path)
+            os.replace(temporary_path, save_path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            copy2(file_path, save_path)
+
+    def save_encoded_image(self, img, save_path, dpi):
+        """Encode the image with the encoder options and write it in one go."""
+        data, quality = encode_image(img, self.encoder_options, dpi)
+        with open(save_path, "wb") as f:
+            f.write(data)
+        if quality != self.encoder_options["quality"]:
+            self.widget.add_to_listbox(
+                f"Quality lowered to {quality} to fit {self.encoder_options['target_size_kb']} KB: {save_path}"
+            )
 
     def process_image(self, img, file_path):
         """Handle all image processing steps."""
@@ -150,13 +552,15 @@ class ImageProcessingHandler:
 
             # Handle CMYK with profile-aware conversion
             elif original_mode == "CMYK":
-                if icc_profile := img.info.get("icc_profile"):
+                icc_profile = img.info.get("icc_profile")
+                transform = (
+                    get_cmyk_to_srgb_transform(icc_profile) if icc_profile else None
+                )
+                if transform:
                     try:
-                        cmyk_profile = ImageCms.getOpenProfile(BytesIO(icc_profile))
-                        rgb_profile = ImageCms.createProfile("sRGB")
-                        img = ImageCms.profileToProfile(img, cmyk_profile, rgb_profile)
+                        img = ImageCms.applyTransform(img, transform)
                         return "success", img
-                    except:
+                    except Exception:
                         img = img.convert("RGB")
                 else:
                     img = img.convert("RGB")
@@ -172,14 +576,43 @@ class ImageProcessingHandler:
             )
             return "error", img.convert("RGB")
 
+    def needs_resize(self, width, height, dpi):
+        """Check if an image is larger than MAX_IMAGE_DIMENSION and should be resized."""
+        return (
+            width > MAX_IMAGE_DIMENSION
+            or height > MAX_IMAGE_DIMENSION
+            and dpi[0] > 150
+        )
+
+    def draft_oversized_image(self, img, original_dpi):
+        """Let the JPEG decoder scale oversized images down by 1/2, 1/4 or 1/8 (DCT scaling)
+        while decoding. The drafted image is never smaller than the resize target,
+        the final resize is still done with LANCZOS in resize_image_if_needed."""
+        if img.format != "JPEG" or not self.needs_resize(
+            img.width, img.height, original_dpi
+        ):
+            return
+        scale_factor = MAX_IMAGE_DIMENSION / max(img.width, img.height)
+        if scale_factor > 0.5:
+            return
+        img.draft(
+            img.mode,
+            (math.ceil(img.width * scale_factor), math.ceil(img.height * scale_factor)),
+        )
+
     def resize_image_if_needed(self, img, filename):
         """Resize image if needed while preserving DPI"""
         original_dpi = img.info.get("dpi", (72, 72))
         try:
-            if img.width > 2500 or img.height > 2500 and original_dpi[0] > 150:
-                scale_factor = 2500 / max(img.width, img.height)
+            if self.needs_resize(img.width, img.height, original_dpi):
+                scale_factor = MAX_IMAGE_DIMENSION / max(img.width, img.height)
                 new_width = int(img.width * scale_factor)
                 new_height = int(img.height * scale_factor)
+                # Reduce by an integer factor first with a fast box filter, keeping at least
+                # twice the target size so the final LANCZOS resample keeps full quality
+                reduce_factor = int(1 / (2 * scale_factor))
+                if reduce_factor >= 2:
+                    img = img.reduce(reduce_factor)
                 resized_img = img.resize((new_width, new_height), Image.LANCZOS)
                 # Ensure the resized image retains the original DPI
                 resized_img.info["dpi"] = original_dpi
@@ -201,19 +634,9 @@ class ImageProcessingHandler:
             return "error", img
 
     def generate_unique_filename(self, destination_folder, filename, suffix):
-        """Generate a unique filename by adding a suffix and incrementing a counter if needed."""
-        base, ext = os.path.splitext(filename)
-        counter = 1
-        new_filename = f"{base}_{suffix}_{counter}{ext}"
-        new_destination_path = os.path.join(destination_folder, new_filename)
-
-        # Keep incrementing the counter if the file already exists
-        while os.path.exists(new_destination_path):
-            counter += 1
-            new_filename = f"{base}_{suffix}_{counter}{ext}"
-            new_destination_path = os.path.join(destination_folder, new_filename)
-
-        return new_destination_path
+        """Generate a unique filename by adding a suffix and a counter.
+        The name is claimed by creating an empty file, which the caller overwrites."""
+        return filename_allocator.allocate(destination_folder, filename, suffix)
 
     def delete_empty_group_folder(self, folder_path):
         """Delete the group folder if it is empty."""
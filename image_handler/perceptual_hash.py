@@ -0,0 +1,84 @@
+import numpy as np
+from PIL import Image
+
+# Hash size in bits per side, a 64 bit dHash is compared over a 9x8 grayscale thumbnail
+DHASH_SIZE = 8
+
+# Images whose hashes differ in at most this many of the 64 bits are treated as duplicates
+DUPLICATE_MAX_DISTANCE = 4
+
+# The dHash is grayscale, so colourways of one product (the same bag in red and blue)
+# hash alike. Duplicates must also have the same colours: a 4x4 RGB grid of the image
+# may differ by at most this much (0-255) in any cell and channel
+COLOR_GRID_SIZE = 4
+COLOR_MAX_DISTANCE = 24
+
+
+def compute_image_fingerprint(file_path):
+    """Compute the 64 bit difference hash (dHash) and a coarse colour grid of an image.
+    JPEGs are decoded at reduced resolution, only tiny thumbnails are needed.
+    Returns (hash, colour grid, pixel count of the original image)
+    or (None, None, 0) if the image could not be read."""
+    try:
+        with Image.open(file_path) as img:
+            pixel_count = img.width * img.height
+            # Let the JPEG decoder scale down by up to 1/8 while decoding
+            img.draft("RGB", (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            rgb_img = img.convert("RGB")
+        thumbnail = rgb_img.convert("L").resize(
+            (DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR
+        )
+        color_grid = rgb_img.resize((COLOR_GRID_SIZE, COLOR_GRID_SIZE), Image.BOX)
+
+        pixels = np.asarray(thumbnail, dtype=np.int16)
+        # One bit per pixel, set when it is brighter than its right neighbour
+        bits = (pixels[:, 1:] < pixels[:, :-1]).flatten()
+        image_hash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+        colors = tuple(np.asarray(color_grid, dtype=np.int16).flatten().tolist())
+        return image_hash, colors, pixel_count
+    except Exception as e:
+        print(f"Could not hash image {file_path}: {e}")
+        return None, None, 0
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def color_distance(colors_a, colors_b):
+    """Largest difference between two colour grids in any cell and channel."""
+    return max(abs(a - b) for a, b in zip(colors_a, colors_b))
+
+
+def find_duplicates(
+    image_fingerprints,
+    max_distance=DUPLICATE_MAX_DISTANCE,
+    max_color_distance=COLOR_MAX_DISTANCE,
+):
+    """Split images into unique images and near-identical duplicates.
+
+    image_fingerprints is a list of (file_path, hash, colour grid, pixel count).
+    Images are duplicates when both their hashes and their colours are close.
+    The largest image of each set of duplicates is kept. Images without a hash are always kept.
+    Returns (kept file paths in their original order, [(duplicate file path, kept file path)])."""
+    kept = []
+    kept_fingerprints = []
+    duplicates = []
+    for file_path, image_hash, colors, _ in sorted(
+        image_fingerprints, key=lambda image: image[3], reverse=True
+    ):
+        if image_hash is None:
+            kept.append(file_path)
+            continue
+        for kept_path, kept_hash, kept_colors in kept_fingerprints:
+            if (
+                hamming_distance(image_hash, kept_hash) <= max_distance
+                and color_distance(colors, kept_colors) <= max_color_distance
+            ):
+                duplicates.append((file_path, kept_path))
+                break
+        else:
+            kept.append(file_path)
+            kept_fingerprints.append((file_path, image_hash, colors))
+    kept = set(kept)
+    return [image[0] for image in image_fingerprints if image[0] in kept], duplicates
@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class TermMatcher:
+    """Aho-Corasick automaton over the search terms of all search groups.
+
+    All terms are compiled into one automaton, so each file name is scanned once
+    no matter how many search terms there are. Matching is case-insensitive.
+
+    Usage:
+        matcher = TermMatcher([["nf0a3", "kanken"], ["fjallraven"]])
+        matcher.match("fjallraven_kanken_nf0a3_blue.jpg")
+        # {(0, "nf0a3"), (0, "kanken"), (1, "fjallraven")}
+    """
+
+    def __init__(self, search_groups):
+        self.transitions = [{}]  # state -> {character: next state}
+        self.failure = [0]  # state -> longest proper suffix state
+        self.outputs = [[]]  # state -> [(group index, search term)] ending in the state
+
+        for group_index, search_terms in enumerate(search_groups):
+            for search_term in search_terms:
+                self.add_term(group_index, search_term.strip())
+        self.build_failure_links()
+
+    def add_term(self, group_index, search_term):
+        if not search_term:
+            return
+        state = 0
+        for character in search_term.lower():
+            next_state = self.transitions[state].get(character)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.failure.append(0)
+                self.outputs.append([])
+                self.transitions[state][character] = next_state
+            state = next_state
+        self.outputs[state].append((group_index, search_term))
+
+    def build_failure_links(self):
+        """Link every state to its longest proper suffix state, breadth first."""
+        states = deque(self.transitions[0].values())
+        while states:
+            state = states.popleft()
+            for character, next_state in self.transitions[state].items():
+                states.append(next_state)
+                fallback = self.failure[state]
+                while fallback and character not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                self.failure[next_state] = self.transitions[fallback].get(character, 0)
+                # Terms ending at the suffix state also end here
+                self.outputs[next_state] = (
+                    self.outputs[next_state] + self.outputs[self.failure[next_state]]
+                )
+
+    def match(self, text):
+        """Scan the text once and return a set of (group index, search term) found in it."""
+        matches = set()
+        state = 0
+        for character in text.lower():
+            while state and character not in self.transitions[state]:
+                state = self.failure[state]
+            state = self.transitions[state].get(character, 0)
+            if self.outputs[state]:
+                matches.update(self.outputs[state])
+        return matches
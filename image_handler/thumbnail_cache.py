@@ -0,0 +1,43 @@
+import os
+import hashlib
+from PIL import Image
+
+# Thumbnails are stored locally, next to the image library index
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".conalite", "thumbnails")
+
+# Longest side of a thumbnail in pixels
+THUMBNAIL_SIZE = 160
+
+
+def thumbnail_cache_path(file_path, cache_dir=THUMBNAIL_CACHE_DIR):
+    """Return the cache path of the thumbnail for the file in its current version.
+    The key includes the mtime and size, so a changed file gets a new thumbnail."""
+    file_stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{file_stat.st_mtime_ns}|{file_stat.st_size}"
+    key_hash = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    # Spread the thumbnails over subfolders to keep the folders small
+    return os.path.join(cache_dir, key_hash[:2], key_hash + ".jpg")
+
+
+def get_thumbnail(file_path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+    """Return the path of a cached thumbnail for the image, creating it if needed.
+    Returns None if the image could not be read."""
+    try:
+        cache_path = thumbnail_cache_path(file_path, cache_dir)
+        if os.path.exists(cache_path):
+            return cache_path
+
+        with Image.open(file_path) as img:
+            # Let the JPEG decoder scale down while decoding
+            img.draft("RGB", (size, size))
+            img.thumbnail((size, size))
+            thumbnail = img.convert("RGB")
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        thumbnail.save(temporary_path, "JPEG", quality=85)
+        os.replace(temporary_path, cache_path)
+        return cache_path
+    except Exception as e:
+        print(f"Could not create thumbnail for {file_path}: {e}")
+        return None
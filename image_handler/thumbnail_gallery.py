@@ -0,0 +1,128 @@
+import os
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QListView
+from PyQt5.QtCore import (
+    Qt,
+    QSize,
+    QUrl,
+    QTimer,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    pyqtSignal,
+)
+from PyQt5.QtGui import QIcon, QPixmap, QDesktopServices
+from image_handler.thumbnail_cache import get_thumbnail, THUMBNAIL_SIZE
+
+# Delay before loading thumbnails after scrolling or resizing, in milliseconds
+LAZY_LOAD_DELAY_MS = 100
+
+
+class ThumbnailSignals(QObject):
+    # Emitted with (image path, thumbnail path or "" if it could not be created)
+    thumbnail_ready = pyqtSignal(str, str)
+
+
+class ThumbnailLoader(QRunnable):
+    """Creates or reads the cached thumbnail of one image on a thread pool thread."""
+
+    def __init__(self, file_path, signals):
+        super().__init__()
+        self.file_path = file_path
+        self.signals = signals
+
+    def run(self):
+        thumbnail_path = get_thumbnail(self.file_path)
+        self.signals.thumbnail_ready.emit(self.file_path, thumbnail_path or "")
+
+
+class ThumbnailGallery(QListWidget):
+    """Preview gallery of image files with lazily loaded thumbnails.
+
+    Thumbnails come from the on-disk cache in thumbnail_cache and are created on
+    background threads. Only the items visible in the viewport are loaded, after
+    scrolling or resizing stops, so galleries with thousands of images stay smooth.
+    Double-click an item to open the image.
+
+    Usage:
+        gallery = ThumbnailGallery()
+        gallery.add_image(save_path)
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setGridSize(QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 40))
+        self.setWordWrap(True)
+
+        self.items_by_path = {}
+        self.requested_paths = set()
+        self.thread_pool = QThreadPool.globalInstance()
+        self.signals = ThumbnailSignals()
+        self.signals.thumbnail_ready.connect(self.set_thumbnail)
+
+        # Collapse bursts of scroll and resize events into one load
+        self.load_timer = QTimer(self)
+        self.load_timer.setSingleShot(True)
+        self.load_timer.setInterval(LAZY_LOAD_DELAY_MS)
+        self.load_timer.timeout.connect(self.load_visible_thumbnails)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_load)
+        self.itemDoubleClicked.connect(self.open_image)
+
+    def add_image(self, file_path):
+        """Add an image to the gallery, its thumbnail is loaded once it becomes visible."""
+        if file_path in self.items_by_path:
+            return
+        item = QListWidgetItem(os.path.basename(file_path))
+        item.setData(Qt.UserRole, file_path)
+        item.setToolTip(file_path)
+        item.setSizeHint(QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 40))
+        self.addItem(item)
+        self.items_by_path[file_path] = item
+        self.schedule_load()
+
+    def clear(self):
+        super().clear()
+        self.items_by_path = {}
+        self.requested_paths = set()
+
+    def schedule_load(self, *args):
+        self.load_timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_load()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_load()
+
+    def load_visible_thumbnails(self):
+        """Start a background loader for every visible item without a thumbnail."""
+        viewport_rect = self.viewport().rect()
+        first_item = self.itemAt(viewport_rect.topLeft())
+        start_row = self.row(first_item) if first_item else 0
+        for row in range(start_row, self.count()):
+            item = self.item(row)
+            item_rect = self.visualItemRect(item)
+            if item_rect.top() > viewport_rect.bottom():
+                break  # Items are laid out in order, the rest are below the viewport
+            file_path = item.data(Qt.UserRole)
+            if file_path in self.requested_paths or not item_rect.intersects(
+                viewport_rect
+            ):
+                continue
+            self.requested_paths.add(file_path)
+            self.thread_pool.start(ThumbnailLoader(file_path, self.signals))
+
+    def set_thumbnail(self, file_path, thumbnail_path):
+        item = self.items_by_path.get(file_path)
+        if item is None or not thumbnail_path:
+            return
+        item.setIcon(QIcon(QPixmap(thumbnail_path)))
+
+    def open_image(self, item):
+        QDesktopServices.openUrl(QUrl.fromLocalFile(item.data(Qt.UserRole)))